@@ -0,0 +1,221 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# A local stand-in for the APIs that the lesson 05 tools call.
+#
+# It implements just enough of these endpoints for the tools to work:
+# * Places API     POST /v1/places:searchText
+# * Routes API     POST /directions/v2:computeRoutes
+#                  POST /distanceMatrix/v2:computeRouteMatrix
+# * ExchangeRate   GET  /v6/{key}/pair/{from}/{to}/{amount}
+#                  GET  /v6/{key}/latest/{base}
+#
+# Answers are made up, but always the same for the same request, so caches
+# behave the way they would against the real APIs. The latency, error rate
+# and payload size can be configured, so we can load test the tools without
+# using any real API quota.
+
+RATES = {
+    "USD": 1.0,
+    "EUR": 0.92,
+    "GBP": 0.79,
+    "JPY": 149.5,
+    "CAD": 1.36,
+    "AUD": 1.52,
+    "INR": 83.2,
+    "MXN": 17.1,
+}
+
+
+class MockConfig:
+    """How the mock server behaves."""
+
+    def __init__(self, latency_ms: float = 50, jitter_ms: float = 10, error_rate: float = 0.0, padding_bytes: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.padding_bytes = padding_bytes
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+def fake_location(text: str) -> dict:
+    """Makes up stable coordinates for a piece of text."""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    latitude = int.from_bytes(digest[:4], "big") / 2**32 * 120 - 60
+    longitude = int.from_bytes(digest[4:8], "big") / 2**32 * 360 - 180
+    return {"latitude": round(latitude, 7), "longitude": round(longitude, 7)}
+
+
+def fake_route(origin: dict, destination: dict) -> dict:
+    """Makes up a route whose length depends on the distance between the points."""
+    lat = origin["latitude"] - destination["latitude"]
+    lng = origin["longitude"] - destination["longitude"]
+    distance_meters = int(((lat ** 2 + lng ** 2) ** 0.5) * 111_000) + 100
+    return {"distanceMeters": distance_meters, "duration": f"{distance_meters // 15 + 30}s"}
+
+
+def waypoint_location(waypoint: dict) -> dict:
+    # computeRoutes sends the location directly, computeRouteMatrix wraps it in "waypoint"
+    waypoint = waypoint.get("waypoint", waypoint)
+    return waypoint["location"]["latLng"]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # The headers and body are sent in separate writes. With Nagle's algorithm
+    # on, the body then waits for the client's delayed ACK (about 40 ms) on
+    # every kept-alive connection, which would make pooled requests look slower
+    # than fresh ones.
+    disable_nagle_algorithm = True
+    config = MockConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _delay_and_maybe_fail(self) -> bool:
+        config = self.config
+        with config.lock:
+            config.requests += 1
+        delay_ms = max(0.0, random.gauss(config.latency_ms, config.jitter_ms))
+        time.sleep(delay_ms / 1000)
+        if random.random() < config.error_rate:
+            self._send_json({"error": {"code": 503, "message": "Mock server error"}}, status=503)
+            return True
+        return False
+
+    def _padding(self) -> str:
+        return "x" * self.config.padding_bytes
+
+    def _send_json(self, data, status: int = 200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", "0"))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        request = self._read_json()
+        if self._delay_and_maybe_fail():
+            return
+
+        if path == "/v1/places:searchText":
+            query = request.get("textQuery", "")
+            self._send_json({
+                "places": [{
+                    "displayName": {"text": query.title()},
+                    "formattedAddress": f"1 {query.title()} Street, Mocktown",
+                    "location": fake_location(query.casefold()),
+                    "padding": self._padding(),
+                }]
+            })
+
+        elif path == "/directions/v2:computeRoutes":
+            route = fake_route(waypoint_location(request["origin"]), waypoint_location(request["destination"]))
+            route["padding"] = self._padding()
+            self._send_json({"routes": [route]})
+
+        elif path == "/distanceMatrix/v2:computeRouteMatrix":
+            elements = []
+            for origin_index, origin in enumerate(request["origins"]):
+                for destination_index, destination in enumerate(request["destinations"]):
+                    element = fake_route(waypoint_location(origin), waypoint_location(destination))
+                    element.update({
+                        "originIndex": origin_index,
+                        "destinationIndex": destination_index,
+                        "status": {},
+                        "condition": "ROUTE_EXISTS",
+                        "padding": self._padding(),
+                    })
+                    elements.append(element)
+            self._send_json(elements)
+
+        else:
+            self._send_json({"error": {"code": 404, "message": f"Unknown path {path}"}}, status=404)
+
+    def do_GET(self):
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if self._delay_and_maybe_fail():
+            return
+
+        # /v6/{key}/pair/{from}/{to}/{amount}
+        if len(parts) == 6 and parts[0] == "v6" and parts[2] == "pair":
+            source, target, amount = parts[3].upper(), parts[4].upper(), float(parts[5])
+            if source not in RATES or target not in RATES:
+                self._send_json({"result": "error", "error-type": "unsupported-code"}, status=404)
+                return
+            rate = RATES[target] / RATES[source]
+            self._send_json({
+                "result": "success",
+                "base_code": source,
+                "target_code": target,
+                "conversion_rate": round(rate, 4),
+                "conversion_result": round(rate * amount, 4),
+                "padding": self._padding(),
+            })
+
+        # /v6/{key}/latest/{base}
+        elif len(parts) == 4 and parts[0] == "v6" and parts[2] == "latest":
+            base = parts[3].upper()
+            if base not in RATES:
+                self._send_json({"result": "error", "error-type": "unsupported-code"}, status=404)
+                return
+            self._send_json({
+                "result": "success",
+                "base_code": base,
+                "conversion_rates": {code: round(rate / RATES[base], 6) for code, rate in RATES.items()},
+                "padding": self._padding(),
+            })
+
+        else:
+            self._send_json({"error": {"code": 404, "message": f"Unknown path {self.path}"}}, status=404)
+
+
+def create_mock_server(config: MockConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Creates a mock server that behaves as described by config."""
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_mock_server(config: MockConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Starts a mock server in a background thread and returns it."""
+    server = create_mock_server(config, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Places, Routes, and ExchangeRate API server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=50, help="Average time to answer a request")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="Standard deviation of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail with a 503")
+    parser.add_argument("--padding-bytes", type=int, default=0, help="Extra bytes added to each result")
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.padding_bytes)
+    server = create_mock_server(config, args.host, args.port)
+    print(f"Mock server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from mock_server import MockConfig, start_mock_server
+
+# Drives the lesson 05 tools against the local mock server and reports
+# latency percentiles and throughput.
+#
+# The tools read their endpoints from environment variables when they are
+# imported, so we start the mock server and set those variables first.
+# Nothing here calls a real Google or ExchangeRate API, and the API keys are
+# put straight into the secret cache instead of being read from Secret Manager.
+#
+# Examples:
+#   python run_benchmark.py
+#   python run_benchmark.py --scenario route --concurrency 32 --requests 2000
+#   python run_benchmark.py --async --latency-ms 100 --json results.json
+
+lesson_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PLACE_NAMES = [
+    "Eiffel Tower", "Times Square", "Golden Gate Bridge", "Big Ben", "Colosseum",
+    "Sydney Opera House", "Brandenburg Gate", "Space Needle", "Louvre Museum",
+    "Central Park", "Tower Bridge", "Sagrada Familia", "Burj Khalifa", "Taj Mahal",
+    "Statue of Liberty", "Shibuya Crossing", "Christ the Redeemer", "Acropolis",
+    "Machu Picchu", "Niagara Falls",
+]
+
+CURRENCIES = ["USD", "EUR", "GBP", "JPY", "CAD", "AUD", "INR", "MXN"]
+
+SCENARIOS = ["places", "places-batch", "route", "matrix", "currency"]
+# The async Places client only speaks gRPC, which the mock server does not
+ASYNC_SCENARIOS = ["route", "matrix", "currency"]
+
+
+def configure_environment(base_url: str, disable_caches: bool):
+    os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "benchmark")
+    os.environ["PLACES_API_ENDPOINT"] = base_url
+    os.environ["PLACES_API_TRANSPORT"] = "rest"
+    os.environ["ROUTES_API_BASE_URL"] = base_url
+    os.environ["EXCHANGE_RATE_API_BASE_URL"] = f"{base_url}/v6"
+    # Always start from an empty geocode cache
+    os.environ["GEOCODE_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "geocode_cache.sqlite")
+    if disable_caches:
+        os.environ["GEOCODE_CACHE_TTL_SECONDS"] = "0"
+        os.environ["ROUTE_CACHE_TTL_SECONDS"] = "0"
+        os.environ["EXCHANGE_RATE_TTL_SECONDS"] = "0"
+
+
+def load_tools():
+    """Imports the sync and async tools from the demo and the exercise solution."""
+    sys.path.insert(0, lesson_dir)
+    from demo import async_tools as places_async_tools
+    from demo import http_transport
+    from demo import secret_cache as places_secret_cache
+    from demo import tools as places_tools
+    from exercises.solution import async_tools as currency_async_tools
+    from exercises.solution import secret_cache as currency_secret_cache
+    from exercises.solution import tools as currency_tools
+
+    project_id = os.environ["GOOGLE_CLOUD_PROJECT"]
+    places_secret_cache.seed_secret(project_id, places_tools.SECRET_ID, "mock-key", ttl_seconds=10**9)
+    currency_secret_cache.seed_secret(project_id, currency_tools.SECRET_ID, "mock-key", ttl_seconds=10**9)
+    return {
+        "places": places_tools,
+        "places_async": places_async_tools,
+        "currency": currency_tools,
+        "currency_async": currency_async_tools,
+        "http_transport": http_transport,
+    }
+
+
+def make_calls(scenario: str, distinct_queries: int, seed: int):
+    """Returns a function that makes the arguments for each call of a scenario."""
+    places = PLACE_NAMES[:distinct_queries] + [f"Mock Place {n}" for n in range(max(0, distinct_queries - len(PLACE_NAMES)))]
+    rng = random.Random(seed)
+
+    def location():
+        # Coordinates with the kind of last-digit noise that Places produces
+        base = places.index(rng.choice(places))
+        return {"latitude": 10 + base * 0.01 + rng.uniform(-1e-5, 1e-5), "longitude": 20 + base * 0.01}
+
+    if scenario == "places":
+        return lambda: (rng.choice(places), rng.choice(places))
+    if scenario == "places-batch":
+        return lambda: ([rng.choice(places) for _ in range(5)],)
+    if scenario == "route":
+        return lambda: (location(), location())
+    if scenario == "matrix":
+        return lambda: ([location() for _ in range(5)], [location() for _ in range(5)])
+    if scenario == "currency":
+        return lambda: (rng.choice(CURRENCIES), rng.choice(CURRENCIES), round(rng.uniform(1, 1000), 2))
+    raise ValueError(f"Unknown scenario {scenario}")
+
+
+def tool_for(tools: dict, scenario: str, use_async: bool):
+    suffix = "_async" if use_async else ""
+    if scenario == "places":
+        return tools["places" + suffix].get_place_details
+    if scenario == "places-batch":
+        return tools["places" + suffix].get_places_details
+    if scenario == "route":
+        return tools["places" + suffix].get_route_between_places
+    if scenario == "matrix":
+        return tools["places" + suffix].get_route_matrix
+    return tools["currency" + suffix].convert_currency
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Returns the nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(scenario: str, latencies: list[float], errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    calls = len(latencies) + errors
+    return {
+        "scenario": scenario,
+        "calls": calls,
+        "errors": errors,
+        "throughput_per_second": calls / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def run_sync(tool, next_args, requests: int, concurrency: int):
+    latencies = []
+    errors = 0
+
+    def call(args):
+        start = time.perf_counter()
+        tool(*args)
+        return time.perf_counter() - start
+
+    all_args = [next_args() for _ in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(call, args) for args in all_args]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    return latencies, errors, time.perf_counter() - start
+
+
+async def run_async(tool, next_args, requests: int, concurrency: int):
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(args):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await tool(*args)
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    all_args = [next_args() for _ in range(requests)]
+    start = time.perf_counter()
+    await asyncio.gather(*[call(args) for args in all_args])
+    return latencies, errors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the lesson 05 tools against a local mock server.")
+    parser.add_argument("--scenario", choices=SCENARIOS + ["all"], default="all")
+    parser.add_argument("--requests", type=int, default=500, help="Tool calls per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="Tool calls in flight at once")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Benchmark the async tools")
+    parser.add_argument("--distinct-queries", type=int, default=20, help="How many different places to ask about")
+    parser.add_argument("--disable-caches", action="store_true", help="Expire cache entries immediately")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--padding-bytes", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.padding_bytes)
+    server = start_mock_server(config)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    configure_environment(base_url, args.disable_caches)
+    tools = load_tools()
+
+    if args.scenario == "all":
+        scenarios = ASYNC_SCENARIOS if args.use_async else SCENARIOS
+    elif args.use_async and args.scenario not in ASYNC_SCENARIOS:
+        parser.error(f"--async supports these scenarios: {', '.join(ASYNC_SCENARIOS)}")
+    else:
+        scenarios = [args.scenario]
+
+    results = []
+    print(f"{'scenario':<14}{'calls':>7}{'errors':>8}{'calls/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for scenario in scenarios:
+        tool = tool_for(tools, scenario, args.use_async)
+        next_args = make_calls(scenario, args.distinct_queries, args.seed)
+        requests_before = config.requests
+        if args.use_async:
+            latencies, errors, elapsed = asyncio.run(run_async(tool, next_args, args.requests, args.concurrency))
+        else:
+            latencies, errors, elapsed = run_sync(tool, next_args, args.requests, args.concurrency)
+        result = summarize(scenario, latencies, errors, elapsed)
+        result["api_requests"] = config.requests - requests_before
+        results.append(result)
+        print(
+            f"{scenario:<14}{result['calls']:>7}{result['errors']:>8}{result['throughput_per_second']:>10.1f}"
+            f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+        )
+
+    report = {
+        "settings": vars(args),
+        "results": results,
+        "geocode_cache": tools["places"].geocode_cache.stats(),
+        "route_cache": tools["places"].route_cache.stats(),
+    }
+    # Only the transport the tools used has anything to report
+    if args.use_async:
+        report["http_transport"] = tools["http_transport"].async_http_transport.stats()
+    else:
+        report["http_transport"] = tools["http_transport"].http_transport.stats()
+    print(json.dumps({key: report[key] for key in ("geocode_cache", "route_cache", "http_transport")}, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
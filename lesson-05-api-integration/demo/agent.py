@@ -1,6 +1,11 @@
 import os
 from google.adk.agents import Agent
-from .tools import get_place_details, get_route_between_places
+
+# Set USE_ASYNC_TOOLS to register the async (non-blocking) versions of the tools
+if os.environ.get("USE_ASYNC_TOOLS", "").lower() in ("1", "true", "yes"):
+    from .async_tools import get_place_details, get_places_details, get_route_between_places, get_route_matrix
+else:
+    from .tools import get_place_details, get_places_details, get_route_between_places, get_route_matrix
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 instruction_file_path = os.path.join(script_dir, "agent-prompt.txt")
@@ -9,7 +14,7 @@ with open(instruction_file_path, "r") as f:
 
 model = "gemini-2.5-flash"
 
-tools = [get_place_details, get_route_between_places]
+tools = [get_place_details, get_places_details, get_route_between_places, get_route_matrix]
 
 root_agent = Agent(
     name="location_agent",
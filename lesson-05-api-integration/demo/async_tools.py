@@ -0,0 +1,228 @@
+import asyncio
+import weakref
+from google.api_core.exceptions import GoogleAPICallError
+from google.maps.places_v1.types import SearchTextRequest
+from .geocode_cache import geocode_cache
+from .http_transport import http_post_async
+from .places_clients import get_places_async_client
+from .route_cache import route_cache
+from .secret_cache import get_secret_async, invalidate_secret, key_rejected
+from .tools import (
+    PLACES_FIELD_MASK,
+    PLACES_MAX_CONCURRENCY,
+    PROJECT_ID,
+    ROUTE_MATRIX_FIELD_MASK,
+    ROUTE_MATRIX_URL,
+    ROUTES_URL,
+    SECRET_ID,
+    TRAVEL_MODE,
+    decode_json_array_items,
+    matrix_result,
+    missing_route_indexes,
+    places_key_rejected,
+    remember_matrix_result,
+    route_matrix_batches,
+    route_request_body,
+    split_cached_routes,
+    to_matrix_result,
+    to_route,
+)
+
+# Async versions of the tools in tools.py.
+#
+# The tools in tools.py wait on the network, which blocks the event loop
+# that the ADK runner uses for every session in this process. These versions
+# have the same names, parameters, and return values, but use the async
+# Places client and an async HTTP client, so other sessions keep running
+# while a tool waits for a response.
+#
+# agent.py registers these instead of the ones in tools.py when
+# USE_ASYNC_TOOLS is set.
+
+# One semaphore per event loop limits how many Places requests run at once
+_places_semaphores = weakref.WeakKeyDictionary()
+
+def places_semaphore() -> asyncio.Semaphore:
+    """Gets the semaphore that limits concurrent Places requests in the running event loop."""
+    loop = asyncio.get_running_loop()
+    semaphore = _places_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(PLACES_MAX_CONCURRENCY)
+        _places_semaphores[loop] = semaphore
+    return semaphore
+
+async def get_api_key():
+    """Gets the API key from Secret Manager, using the shared secret cache."""
+    return await get_secret_async(PROJECT_ID, SECRET_ID)
+
+async def get_details(client, place_name: str):
+    """Gets the name, address, and coordinates for the best match of a place name."""
+    request = SearchTextRequest(
+        text_query = place_name,
+    )
+    response = await client.search_text( request=request, metadata=[('x-goog-fieldmask', PLACES_FIELD_MASK)] )
+    if response and response.places:
+        info = response.places[0]
+        return {
+            "name": info.display_name.text,
+            "address": info.formatted_address,
+            "location": {
+                "latitude": info.location.latitude,
+                "longitude": info.location.longitude,
+            }
+        }
+
+    return None
+
+async def lookup_place(place_name: str):
+    """
+    Looks up one place, using the geocode cache if we have seen it before.
+    Retries once with the latest key if the key was rejected.
+    """
+    # A miss in memory reads the SQLite file, which can wait on the disk, so
+    # the cache is only used from a worker thread
+    found, details = await asyncio.to_thread(geocode_cache.get, place_name, PLACES_FIELD_MASK)
+    if found:
+        return details
+
+    async with places_semaphore():
+        try:
+            details = await get_details(get_places_async_client(await get_api_key()), place_name)
+        except GoogleAPICallError as e:
+            if not places_key_rejected(e):
+                raise
+            # The key may have been rotated, so get the latest one and try again
+            invalidate_secret(PROJECT_ID, SECRET_ID)
+            details = await get_details(get_places_async_client(await get_api_key()), place_name)
+
+    await asyncio.to_thread(geocode_cache.put, place_name, PLACES_FIELD_MASK, details)
+    return details
+
+async def lookup_places(places: list[str]):
+    """
+    Looks up several places at the same time.
+    Returns a (details, error) pair for each place, in the same order as places.
+    """
+    results = await asyncio.gather(
+        *[lookup_place(place_name) for place_name in places],
+        return_exceptions=True,
+    )
+    return [
+        (None, result) if isinstance(result, Exception) else (result, None)
+        for result in results
+    ]
+
+async def get_places_details(places: list[str]):
+    """Gets the address and coordinates for each place in a list of places."""
+    results = []
+    for place_name, (details, error) in zip(places, await lookup_places(places)):
+        if error is not None:
+            results.append({"query": place_name, "error": str(error)})
+        else:
+            results.append({"query": place_name, "details": details})
+
+    return {"places": results}
+
+async def get_place_details(place1: str, place2: str):
+    """Gets the address and coordinates for two places."""
+    (details1, error1), (details2, error2) = await lookup_places([place1, place2])
+    for error in (error1, error2):
+        if error is not None:
+            raise error
+
+    return {"place1": details1, "place2": details2}
+
+async def post_routes_request(url: str, headers: dict, request_body: dict, stream: bool = False):
+    """
+    Sends a request to the Routes API, retrying once with the latest key if the key was rejected.
+    With stream=True, the caller must call aclose() on the response.
+    """
+    response = await http_post_async(url, headers=headers, json=request_body, stream=stream)
+    if response.status_code == 400 and stream:
+        # Read the error, to see whether it is about the key
+        await response.aread()
+    if key_rejected(response):
+        # The key may have been rotated, so get the latest one and try again
+        await response.aclose()
+        invalidate_secret(PROJECT_ID, SECRET_ID)
+        headers["X-Goog-Api-Key"] = await get_api_key()
+        response = await http_post_async(url, headers=headers, json=request_body, stream=stream)
+    if response.is_error:
+        if stream:
+            await response.aread()
+        response.raise_for_status()  # Raise an exception for HTTP errors
+    return response
+
+async def get_route_between_places(location1: dict, location2: dict):
+    """Gets the distance and duration of the route between two places."""
+    # The route cache can also be kept in SQLite (see ROUTE_CACHE_PATH), so
+    # it is used from a worker thread too
+    found, route = await asyncio.to_thread(route_cache.get, location1, location2, TRAVEL_MODE)
+    if found:
+        return route
+
+    headers = {
+        "Content-Type": "application/json",
+        "X-Goog-Api-Key": await get_api_key(),
+        "X-Goog-FieldMask": "routes.distanceMeters,routes.duration",
+    }
+    response = await post_routes_request(ROUTES_URL, headers, route_request_body(location1, location2))
+    route = to_route(response.json())
+
+    await asyncio.to_thread(route_cache.put, location1, location2, TRAVEL_MODE, route)
+    return route
+
+async def request_route_matrix(origins: list[dict], destinations: list[dict]):
+    """Yields the route between each origin and destination as the results arrive."""
+    headers = {
+        "Content-Type": "application/json",
+        "X-Goog-Api-Key": await get_api_key(),
+        "X-Goog-FieldMask": ROUTE_MATRIX_FIELD_MASK,
+    }
+
+    for request_body, origin_start, destination_start in route_matrix_batches(origins, destinations):
+        response = await post_routes_request(ROUTE_MATRIX_URL, headers, request_body, stream=True)
+        try:
+            buffer = ""
+            async for text in response.aiter_text():
+                elements, buffer = decode_json_array_items(buffer + text)
+                for element in elements:
+                    yield to_matrix_result(element, origin_start, destination_start)
+        finally:
+            await response.aclose()
+
+async def iter_route_matrix(origins: list[dict], destinations: list[dict]):
+    """
+    Yields the route between each origin and destination.
+    Cached routes are yielded first, then the rest as they arrive from the API.
+    """
+    cached, missing = split_cached_routes(origins, destinations)
+    for result in cached:
+        yield result
+    if not missing:
+        return
+
+    # Only request the origins and destinations that still have a missing route
+    origin_indexes, destination_indexes = missing_route_indexes(missing)
+    results = request_route_matrix(
+        [origins[origin_index] for origin_index in origin_indexes],
+        [destinations[destination_index] for destination_index in destination_indexes],
+    )
+    async for result in results:
+        result = remember_matrix_result(result, origins, destinations, origin_indexes, destination_indexes)
+        if (result["origin_index"], result["destination_index"]) in missing:
+            yield result
+
+async def get_route_matrix(origins: list[dict], destinations: list[dict]):
+    """
+    Gets the distance and duration of the routes from each origin to each destination.
+    The agent needs the whole matrix in one tool result, so this collects every route before returning.
+    Use iter_route_matrix() to handle each route as soon as it arrives.
+    """
+    if len(origins) == 1 and len(destinations) == 1:
+        route = await get_route_between_places(origins[0], destinations[0])
+        return {"routes": [matrix_result(0, 0, route)]}
+
+    routes = [route async for route in iter_route_matrix(origins, destinations)]
+    routes.sort(key=lambda route: (route["origin_index"], route["destination_index"]))
+    return {"routes": routes}
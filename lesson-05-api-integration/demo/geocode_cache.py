@@ -0,0 +1,137 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# A two-level cache for Places text search results.
+#
+# The same venues ("Eiffel Tower", "Times Square") are looked up again and
+# again, and every lookup costs a Places API call. We keep recent results in
+# memory, in a least-recently-used (LRU) list, and every result on disk in a
+# SQLite database so they survive restarts and are shared between processes
+# on the same machine.
+#
+# Results are keyed by the normalized query text plus the field mask, since
+# a different field mask returns different data. Entries expire after a TTL,
+# and both levels are limited in size, dropping the oldest entries first.
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+GEOCODE_CACHE_PATH = os.environ.get("GEOCODE_CACHE_PATH", os.path.join(script_dir, "geocode_cache.sqlite"))
+GEOCODE_CACHE_TTL_SECONDS = float(os.environ.get("GEOCODE_CACHE_TTL_SECONDS", str(30 * 24 * 60 * 60)))
+GEOCODE_CACHE_MEMORY_ENTRIES = int(os.environ.get("GEOCODE_CACHE_MEMORY_ENTRIES", "1024"))
+GEOCODE_CACHE_DISK_ENTRIES = int(os.environ.get("GEOCODE_CACHE_DISK_ENTRIES", "100000"))
+
+
+def normalize_query(query: str) -> str:
+    """Normalizes case and whitespace so trivially different queries share an entry."""
+    return " ".join(query.casefold().split())
+
+
+class GeocodeCache:
+    """An in-memory LRU cache in front of a SQLite cache."""
+
+    def __init__(
+        self,
+        path: str = GEOCODE_CACHE_PATH,
+        ttl_seconds: float = GEOCODE_CACHE_TTL_SECONDS,
+        memory_entries: int = GEOCODE_CACHE_MEMORY_ENTRIES,
+        disk_entries: int = GEOCODE_CACHE_DISK_ENTRIES,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._puts = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _get_db(self) -> sqlite3.Connection:
+        # Opened on first use so importing the tools never touches the disk
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS geocode (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS geocode_created_at ON geocode (created_at)")
+            self._db.commit()
+        return self._db
+
+    def _remember(self, key: str, value, created_at: float):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, query: str, field_mask: str):
+        """Returns (True, result) for a cached lookup, or (False, None) if it must be fetched."""
+        key = f"{normalize_query(query)}|{field_mask}"
+        oldest = time.time() - self.ttl_seconds
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None and cached[1] >= oldest:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return True, cached[0]
+
+            row = self._get_db().execute(
+                "SELECT value, created_at FROM geocode WHERE key = ? AND created_at >= ?",
+                (key, oldest),
+            ).fetchone()
+            if row is not None:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])
+                self.disk_hits += 1
+                return True, value
+
+            self.misses += 1
+            return False, None
+
+    def put(self, query: str, field_mask: str, value):
+        """Stores a lookup result (which may be None if nothing matched)."""
+        key = f"{normalize_query(query)}|{field_mask}"
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            db = self._get_db()
+            db.execute(
+                "INSERT OR REPLACE INTO geocode (key, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now),
+            )
+            self._puts += 1
+            if self._puts % 100 == 1:
+                # Every so often, drop expired entries and then the oldest
+                # ones if we are over the size limit
+                db.execute("DELETE FROM geocode WHERE created_at < ?", (now - self.ttl_seconds,))
+                db.execute(
+                    "DELETE FROM geocode WHERE key IN ("
+                    "  SELECT key FROM geocode ORDER BY created_at DESC LIMIT -1 OFFSET ?"
+                    ")",
+                    (self.disk_entries,),
+                )
+            db.commit()
+
+    def stats(self) -> dict:
+        """Returns hit and miss counts for each level of the cache."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+
+geocode_cache = GeocodeCache()
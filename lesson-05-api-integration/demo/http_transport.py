@@ -0,0 +1,245 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# A shared HTTP transport for the tools that call REST APIs.
+#
+# Calling requests.get() or requests.post() directly opens a new TCP and TLS
+# connection for every request, and waits forever if the server never
+# answers. Instead, all the tools share one requests.Session, which keeps a
+# pool of open connections to each host and reuses them (HTTP keep-alive).
+#
+# Every request gets a connect timeout and a read timeout. Requests that fail
+# with a connection error, a timeout, or a status that usually means "try
+# again later" are retried after a short, random, exponentially growing
+# delay. Each request may only be retried a limited number of times (its
+# retry budget), so a failing API can't hold a tool call up indefinitely.
+#
+# The async tools use AsyncHttpTransport, which does the same with an
+# httpx.AsyncClient. Those clients are tied to the event loop they were
+# created in, so there is one for each running loop.
+
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "10"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("HTTP_CONNECT_TIMEOUT_SECONDS", "3.05"))
+HTTP_READ_TIMEOUT_SECONDS = float(os.environ.get("HTTP_READ_TIMEOUT_SECONDS", "30"))
+HTTP_RETRY_BUDGET = int(os.environ.get("HTTP_RETRY_BUDGET", "3"))
+HTTP_BACKOFF_BASE_SECONDS = float(os.environ.get("HTTP_BACKOFF_BASE_SECONDS", "0.25"))
+HTTP_BACKOFF_MAX_SECONDS = float(os.environ.get("HTTP_BACKOFF_MAX_SECONDS", "4"))
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class _CountingAdapter(HTTPAdapter):
+    """An HTTPAdapter that tells the transport each time it opens a new connection."""
+
+    def __init__(self, on_new_connection, **kwargs):
+        self._on_new_connection = on_new_connection
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        on_new_connection = self._on_new_connection
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            def _new_conn(self):
+                on_new_connection()
+                return super()._new_conn()
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            def _new_conn(self):
+                on_new_connection()
+                return super()._new_conn()
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+
+class HttpTransport:
+    """A pooled requests.Session with timeouts and retries."""
+
+    def __init__(
+        self,
+        pool_size: int = HTTP_POOL_SIZE,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT_SECONDS,
+        read_timeout: float = HTTP_READ_TIMEOUT_SECONDS,
+        retry_budget: int = HTTP_RETRY_BUDGET,
+        backoff_base: float = HTTP_BACKOFF_BASE_SECONDS,
+        backoff_max: float = HTTP_BACKOFF_MAX_SECONDS,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retry_budget = retry_budget
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lock = threading.Lock()
+        self.requests_sent = 0
+        self.connections_opened = 0
+        self.retries = 0
+
+        # We do our own retries, so the adapter doesn't retry anything
+        adapter = _CountingAdapter(
+            self._count_new_connection,
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=0,
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _count_new_connection(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": a random delay up to an exponentially growing limit
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method: str, url: str, retry_budget: int = None, **kwargs) -> requests.Response:
+        """Sends a request, retrying temporary failures up to the retry budget."""
+        if retry_budget is None:
+            retry_budget = self.retry_budget
+        kwargs.setdefault("timeout", self.timeout)
+
+        attempt = 0
+        while True:
+            with self._lock:
+                self.requests_sent += 1
+            try:
+                response = self.session.request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= retry_budget:
+                    return response
+                response.close()
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= retry_budget:
+                    raise
+
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+            with self._lock:
+                self.retries += 1
+
+    def stats(self) -> dict:
+        """Returns how many requests were sent and how often a pooled connection was reused."""
+        with self._lock:
+            reused = max(0, self.requests_sent - self.connections_opened)
+            return {
+                "requests_sent": self.requests_sent,
+                "connections_opened": self.connections_opened,
+                "connections_reused": reused,
+                "reuse_rate": reused / self.requests_sent if self.requests_sent else 0.0,
+                "retries": self.retries,
+            }
+
+
+class AsyncHttpTransport:
+    """A pooled httpx.AsyncClient for each event loop, with timeouts and retries."""
+
+    def __init__(
+        self,
+        pool_size: int = HTTP_POOL_SIZE,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT_SECONDS,
+        read_timeout: float = HTTP_READ_TIMEOUT_SECONDS,
+        retry_budget: int = HTTP_RETRY_BUDGET,
+        backoff_base: float = HTTP_BACKOFF_BASE_SECONDS,
+        backoff_max: float = HTTP_BACKOFF_MAX_SECONDS,
+    ):
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.retry_budget = retry_budget
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._clients = weakref.WeakKeyDictionary()
+        self.requests_sent = 0
+        self.connections_opened = 0
+        self.retries = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+            self._clients[loop] = client
+        return client
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _trace(self, event: str, info: dict):
+        # httpcore calls this at each step of a request, and only connects
+        # when the pool has no idle connection to reuse
+        if event == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+
+    async def request(
+        self, method: str, url: str, retry_budget: int = None, stream: bool = False, **kwargs
+    ) -> httpx.Response:
+        """
+        Sends a request, retrying temporary failures up to the retry budget.
+        With stream=True the body is not read yet, and the caller must call aclose() on the response.
+        """
+        if retry_budget is None:
+            retry_budget = self.retry_budget
+        client = self._get_client()
+
+        attempt = 0
+        while True:
+            self.requests_sent += 1
+            try:
+                request = client.build_request(method, url, extensions={"trace": self._trace}, **kwargs)
+                response = await client.send(request, stream=stream)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= retry_budget:
+                    return response
+                await response.aclose()
+            except httpx.TransportError:
+                if attempt >= retry_budget:
+                    raise
+
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+            self.retries += 1
+
+    def stats(self) -> dict:
+        """Returns how many requests were sent and how often a pooled connection was reused."""
+        reused = max(0, self.requests_sent - self.connections_opened)
+        return {
+            "requests_sent": self.requests_sent,
+            "connections_opened": self.connections_opened,
+            "connections_reused": reused,
+            "reuse_rate": reused / self.requests_sent if self.requests_sent else 0.0,
+            "retries": self.retries,
+            "open_clients": len(self._clients),
+        }
+
+
+http_transport = HttpTransport()
+async_http_transport = AsyncHttpTransport()
+
+
+def http_get(url: str, **kwargs) -> requests.Response:
+    """Sends a GET request using the shared transport."""
+    return http_transport.request("GET", url, **kwargs)
+
+
+def http_post(url: str, **kwargs) -> requests.Response:
+    """Sends a POST request using the shared transport."""
+    return http_transport.request("POST", url, **kwargs)
+
+
+async def http_get_async(url: str, **kwargs) -> httpx.Response:
+    """Sends a GET request using the shared async transport."""
+    return await async_http_transport.request("GET", url, **kwargs)
+
+
+async def http_post_async(url: str, **kwargs) -> httpx.Response:
+    """Sends a POST request using the shared async transport."""
+    return await async_http_transport.request("POST", url, **kwargs)
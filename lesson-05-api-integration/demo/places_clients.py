@@ -0,0 +1,100 @@
+import asyncio
+import os
+import threading
+import weakref
+from google.maps.places_v1 import PlacesAsyncClient, PlacesClient
+
+# A process-wide registry of Places API clients.
+#
+# Each PlacesClient owns a gRPC channel, and creating one means a new
+# connection and TLS handshake. Instead of creating a client for every tool
+# call, we keep one client per endpoint and hand the same one out each time.
+# The sync client is safe to share between threads.
+#
+# Async clients are tied to the event loop they were created in, so those are
+# kept separately for each running loop.
+#
+# Clients are created with a specific API key. If the key changes (because it
+# was rotated in Secret Manager), the next request for that endpoint builds a
+# new client with the new key and the old one is released.
+
+PLACES_API_ENDPOINT = os.environ.get("PLACES_API_ENDPOINT", PlacesClient.DEFAULT_ENDPOINT)
+# The sync client can use "rest" instead of "grpc", for example to talk to a
+# local mock server. The async client always uses gRPC.
+PLACES_API_TRANSPORT = os.environ.get("PLACES_API_TRANSPORT", "grpc")
+
+
+class _RegisteredClient:
+    def __init__(self, api_key: str, client):
+        self.api_key = api_key
+        self.client = client
+
+
+class PlacesClientRegistry:
+    """Hands out shared Places clients, keyed by API key and endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._created = 0
+        self._requests = 0
+
+    def _get(self, clients: dict, client_class, api_key: str, endpoint: str, transport: str):
+        with self._lock:
+            self._requests += 1
+            registered = clients.get(endpoint)
+            if registered is None or registered.api_key != api_key:
+                client = client_class(
+                    client_options={
+                        "api_key": api_key,
+                        "api_endpoint": endpoint,
+                    },
+                    transport=transport,
+                )
+                # Any previous client is released once in-flight calls finish with it
+                registered = _RegisteredClient(api_key, client)
+                clients[endpoint] = registered
+                self._created += 1
+            return registered.client
+
+    def get_client(self, api_key: str, endpoint: str = PLACES_API_ENDPOINT) -> PlacesClient:
+        """Returns the shared sync client for this API key and endpoint."""
+        return self._get(self._clients, PlacesClient, api_key, endpoint, PLACES_API_TRANSPORT)
+
+    def get_async_client(self, api_key: str, endpoint: str = PLACES_API_ENDPOINT) -> PlacesAsyncClient:
+        """Returns the shared async client for this API key, endpoint, and running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+        return self._get(clients, PlacesAsyncClient, api_key, endpoint, "grpc_asyncio")
+
+    def stats(self) -> dict:
+        """Returns how many channels are open and how often a client was reused."""
+        with self._lock:
+            open_channels = len(self._clients) + sum(len(clients) for clients in self._async_clients.values())
+            reused = self._requests - self._created
+            return {
+                "open_channels": open_channels,
+                "clients_created": self._created,
+                "client_requests": self._requests,
+                "reuse_rate": reused / self._requests if self._requests else 0.0,
+            }
+
+
+_registry = PlacesClientRegistry()
+
+
+def get_places_client(api_key: str, endpoint: str = PLACES_API_ENDPOINT) -> PlacesClient:
+    """Gets the shared PlacesClient for an API key and endpoint."""
+    return _registry.get_client(api_key, endpoint)
+
+
+def get_places_async_client(api_key: str, endpoint: str = PLACES_API_ENDPOINT) -> PlacesAsyncClient:
+    """Gets the shared PlacesAsyncClient for an API key and endpoint in the running event loop."""
+    return _registry.get_async_client(api_key, endpoint)
+
+
+def places_client_stats() -> dict:
+    """Gets channel count and reuse-rate metrics for the shared Places clients."""
+    return _registry.stats()
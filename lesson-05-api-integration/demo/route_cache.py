@@ -0,0 +1,129 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# A cache of Routes API results.
+#
+# Coordinates returned by Places for the same venue can differ in the last
+# few decimal places, so we round ("quantize") the latitude and longitude of
+# both ends before using them as the cache key. With the default of 3
+# decimal places, points within roughly 100 meters share a cache entry.
+#
+# Travel times change with traffic, so entries expire after a fairly short
+# TTL. Entries are kept in memory, and can optionally also be written to a
+# SQLite file so they survive restarts.
+
+ROUTE_CACHE_PRECISION = int(os.environ.get("ROUTE_CACHE_PRECISION", "3"))
+ROUTE_CACHE_TTL_SECONDS = float(os.environ.get("ROUTE_CACHE_TTL_SECONDS", "900"))
+ROUTE_CACHE_MEMORY_ENTRIES = int(os.environ.get("ROUTE_CACHE_MEMORY_ENTRIES", "4096"))
+ROUTE_CACHE_PATH = os.environ.get("ROUTE_CACHE_PATH")
+
+
+class RouteCache:
+    """Caches routes keyed on quantized coordinates and travel mode."""
+
+    def __init__(
+        self,
+        precision: int = ROUTE_CACHE_PRECISION,
+        ttl_seconds: float = ROUTE_CACHE_TTL_SECONDS,
+        memory_entries: int = ROUTE_CACHE_MEMORY_ENTRIES,
+        path: str = ROUTE_CACHE_PATH,
+    ):
+        self.precision = precision
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self.path = path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+
+    def _get_db(self):
+        # Only used if a path was configured
+        if self._db is None and self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS routes (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._db.commit()
+        return self._db
+
+    def make_key(self, origin: dict, destination: dict, travel_mode: str) -> str:
+        """Builds the cache key for a route from its quantized end points."""
+        points = [
+            round(origin["latitude"], self.precision),
+            round(origin["longitude"], self.precision),
+            round(destination["latitude"], self.precision),
+            round(destination["longitude"], self.precision),
+        ]
+        # Adding 0.0 turns -0.0 into 0.0 so both round to the same key
+        return ",".join(f"{point + 0.0:.{self.precision}f}" for point in points) + f"|{travel_mode}"
+
+    def _remember(self, key: str, value, created_at: float):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, origin: dict, destination: dict, travel_mode: str):
+        """Returns (True, route) for a cached route, or (False, None) if it must be fetched."""
+        key = self.make_key(origin, destination, travel_mode)
+        oldest = time.time() - self.ttl_seconds
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None and cached[1] >= oldest:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return True, cached[0]
+
+            db = self._get_db()
+            if db is not None:
+                row = db.execute(
+                    "SELECT value, created_at FROM routes WHERE key = ? AND created_at >= ?",
+                    (key, oldest),
+                ).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1])
+                    self.hits += 1
+                    return True, value
+
+            self.misses += 1
+            return False, None
+
+    def put(self, origin: dict, destination: dict, travel_mode: str, route):
+        """Stores a route (which may be None if there is no route)."""
+        key = self.make_key(origin, destination, travel_mode)
+        now = time.time()
+        with self._lock:
+            self._remember(key, route, now)
+            db = self._get_db()
+            if db is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO routes (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(route), now),
+                )
+                db.execute("DELETE FROM routes WHERE created_at < ?", (now - self.ttl_seconds,))
+                db.commit()
+
+    def stats(self) -> dict:
+        """Returns hit and miss counts."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+
+route_cache = RouteCache()
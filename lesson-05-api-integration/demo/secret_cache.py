@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from google.cloud import secretmanager
+
+# A process-wide cache for values stored in Secret Manager.
+#
+# Our tools need an API key for every request they make. Reading it from
+# Secret Manager each time costs a network round trip (plus creating a new
+# client), so instead we keep each secret in memory for a limited time (its
+# TTL). Shortly before the TTL runs out, the next caller starts a refresh in
+# a background thread and keeps using the current value, so tool calls
+# almost never wait on Secret Manager.
+#
+# Only one thread fetches a given secret at a time. If many sessions need the
+# same secret while it is missing or expired, one of them fetches it and the
+# others wait for that result instead of all calling Secret Manager at once.
+#
+# If an API rejects the key, call invalidate_secret() so the next request
+# reads the latest version of the secret. Use key_rejected() to tell: as well
+# as 401 and 403, Google APIs answer a deleted or rotated-out key with 400
+# INVALID_ARGUMENT and the reason API_KEY_INVALID.
+
+DEFAULT_TTL_SECONDS = float(os.environ.get("SECRET_CACHE_TTL_SECONDS", "300"))
+DEFAULT_REFRESH_AHEAD_SECONDS = float(os.environ.get("SECRET_CACHE_REFRESH_AHEAD_SECONDS", "30"))
+
+# The reasons an API gives when it rejects a key with HTTP 400: Google's
+# ErrorInfo reason, and the error-type from ExchangeRate-API
+INVALID_KEY_REASONS = {"API_KEY_INVALID", "invalid-key"}
+
+
+class _CachedSecret:
+    def __init__(self, value: str, ttl_seconds: float):
+        self.value = value
+        self.ttl_seconds = ttl_seconds
+        self.expires_at = time.monotonic() + ttl_seconds
+
+
+class SecretCache:
+    """Caches Secret Manager values with a per-secret TTL."""
+
+    def __init__(
+        self,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        refresh_ahead_seconds: float = DEFAULT_REFRESH_AHEAD_SECONDS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_ahead_seconds = refresh_ahead_seconds
+        self._secrets = {}
+        self._fetch_locks = {}
+        self._lock = threading.Lock()
+        self._client = None
+
+    def _get_client(self):
+        # The client is created once and shared, since it holds the gRPC channel
+        with self._lock:
+            if self._client is None:
+                self._client = secretmanager.SecretManagerServiceClient()
+            return self._client
+
+    def _fetch_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._fetch_locks.setdefault(name, threading.Lock())
+
+    def _fetch(self, name: str, ttl_seconds: float) -> str:
+        response = self._get_client().access_secret_version(name=name)
+        value = response.payload.data.decode("UTF-8")
+        self._secrets[name] = _CachedSecret(value, ttl_seconds)
+        return value
+
+    def _refresh_in_background(self, name: str, ttl_seconds: float):
+        fetch_lock = self._fetch_lock(name)
+        if not fetch_lock.acquire(blocking=False):
+            # Someone is already fetching this secret
+            return
+
+        def refresh():
+            try:
+                self._fetch(name, ttl_seconds)
+            except Exception as e:
+                # Keep serving the current value until it expires
+                print(f"Unable to refresh secret {name}: {e}")
+            finally:
+                fetch_lock.release()
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def peek(self, project_id: str, secret_id: str, version: str = "latest") -> str:
+        """Returns the cached secret value, or None if it must be fetched from Secret Manager."""
+        name = f"projects/{project_id}/secrets/{secret_id}/versions/{version}"
+        cached = self._secrets.get(name)
+        if cached is not None:
+            remaining = cached.expires_at - time.monotonic()
+            if remaining > 0:
+                if remaining < self.refresh_ahead_seconds:
+                    self._refresh_in_background(name, cached.ttl_seconds)
+                return cached.value
+        return None
+
+    def get(self, project_id: str, secret_id: str, version: str = "latest", ttl_seconds: float = None) -> str:
+        """Returns the secret value, fetching it from Secret Manager only when needed."""
+        value = self.peek(project_id, secret_id, version)
+        if value is not None:
+            return value
+
+        name = f"projects/{project_id}/secrets/{secret_id}/versions/{version}"
+        if ttl_seconds is None:
+            ttl_seconds = self.ttl_seconds
+        with self._fetch_lock(name):
+            # Another thread may have fetched it while we were waiting
+            cached = self._secrets.get(name)
+            if cached is not None and cached.expires_at > time.monotonic():
+                return cached.value
+            return self._fetch(name, ttl_seconds)
+
+    def put(self, project_id: str, secret_id: str, value: str, version: str = "latest", ttl_seconds: float = None):
+        """Stores a secret value in the cache without calling Secret Manager."""
+        name = f"projects/{project_id}/secrets/{secret_id}/versions/{version}"
+        if ttl_seconds is None:
+            ttl_seconds = self.ttl_seconds
+        self._secrets[name] = _CachedSecret(value, ttl_seconds)
+
+    def invalidate(self, project_id: str, secret_id: str, version: str = "latest"):
+        """Drops a cached secret so the next get() reads it from Secret Manager."""
+        name = f"projects/{project_id}/secrets/{secret_id}/versions/{version}"
+        self._secrets.pop(name, None)
+
+
+_secret_cache = SecretCache()
+
+
+def get_secret(project_id: str, secret_id: str, ttl_seconds: float = None) -> str:
+    """Gets the latest version of a secret from the shared cache."""
+    return _secret_cache.get(project_id, secret_id, ttl_seconds=ttl_seconds)
+
+
+async def get_secret_async(project_id: str, secret_id: str, ttl_seconds: float = None) -> str:
+    """Like get_secret, but only blocks a worker thread, not the event loop, when it calls Secret Manager."""
+    value = _secret_cache.peek(project_id, secret_id)
+    if value is not None:
+        return value
+    return await asyncio.to_thread(get_secret, project_id, secret_id, ttl_seconds)
+
+
+def seed_secret(project_id: str, secret_id: str, value: str, ttl_seconds: float = None):
+    """Puts a secret value in the shared cache, for example when running against a mock server."""
+    _secret_cache.put(project_id, secret_id, value, ttl_seconds=ttl_seconds)
+
+
+def invalidate_secret(project_id: str, secret_id: str):
+    """Forgets a cached secret, typically after an API rejected it."""
+    _secret_cache.invalidate(project_id, secret_id)
+
+
+def key_rejected(response) -> bool:
+    """
+    Checks whether an HTTP response (from requests or httpx) means the API rejected the key.
+    A streamed httpx response must have been read before a 400 can be checked.
+    """
+    if response.status_code in (401, 403):
+        return True
+    if response.status_code != 400:
+        return False
+    try:
+        error = json.loads(response.text)
+    except ValueError:
+        return False
+    if not isinstance(error, dict):
+        return False
+    reasons = {error.get("error-type")}
+    details = error.get("error", {}).get("details", []) if isinstance(error.get("error"), dict) else []
+    reasons.update(detail.get("reason") for detail in details if isinstance(detail, dict))
+    return bool(reasons & INVALID_KEY_REASONS)
@@ -1,67 +1,144 @@
+import json
 import os
-from google.cloud import secretmanager
-from google.maps.places_v1 import PlacesClient
+from concurrent.futures import ThreadPoolExecutor
+from google.api_core.exceptions import GoogleAPICallError, InvalidArgument, PermissionDenied, Unauthenticated
 from google.maps.places_v1.types import SearchTextRequest
-import requests
+from .geocode_cache import geocode_cache
+from .http_transport import http_post
+from .places_clients import get_places_client
+from .route_cache import route_cache
+from .secret_cache import INVALID_KEY_REASONS, get_secret, invalidate_secret, key_rejected
 
 PROJECT_ID = os.environ.get("GOOGLE_CLOUD_PROJECT")
 SECRET_ID = "places-api-key"
 
+TRAVEL_MODE = "DRIVE"
+ROUTES_API_BASE_URL = os.environ.get("ROUTES_API_BASE_URL", "https://routes.googleapis.com")
+ROUTES_URL = f"{ROUTES_API_BASE_URL}/directions/v2:computeRoutes"
+
 def get_api_key():
-    """Gets the API key from Secret Manager."""
-    client = secretmanager.SecretManagerServiceClient()
-    name = f"projects/{PROJECT_ID}/secrets/{SECRET_ID}/versions/latest"
-    response = client.access_secret_version(name=name)
-    return response.payload.data.decode("UTF-8")
+    """Gets the API key from Secret Manager, using the shared secret cache."""
+    return get_secret(PROJECT_ID, SECRET_ID)
 
-def get_place_details(place1: str, place2: str):
-    """Gets the address and coordinates for two places."""
-    api_key = get_api_key()
-    client = PlacesClient(client_options={
-        "api_key": api_key,
-    })
-
-    def get_details(place_name):
-        fields = ['places.displayName', 'places.formattedAddress', 'places.location']
-        field_mask = ",".join(fields)
-        request = SearchTextRequest(
-            text_query = place_name,
-        )
-        response = client.search_text( request=request, metadata=[('x-goog-fieldmask', field_mask)] )
-        if response and response.places:
-            info = response.places[0]
-            name = info.display_name.text
-            address = info.formatted_address
-            location = info.location
-            latitude = location.latitude
-            longitude = location.longitude
-
-            return {
-                "name": name,
-                "address": address,
-                "location": {
-                    "latitude": latitude,
-                    "longitude": longitude,
-                }
+def places_key_rejected(error: GoogleAPICallError) -> bool:
+    """Checks whether a Places error means the key was rejected, including a 400 with the reason API_KEY_INVALID."""
+    if isinstance(error, (Unauthenticated, PermissionDenied)):
+        return True
+    return isinstance(error, InvalidArgument) and error.reason in INVALID_KEY_REASONS
+
+# Place lookups run on a shared pool of threads, which also limits how many
+# Places requests this process makes at the same time
+PLACES_MAX_CONCURRENCY = int(os.environ.get("PLACES_MAX_CONCURRENCY", "8"))
+places_executor = ThreadPoolExecutor(max_workers=PLACES_MAX_CONCURRENCY, thread_name_prefix="places")
+
+PLACES_FIELD_MASK = ",".join(['places.displayName', 'places.formattedAddress', 'places.location'])
+
+def get_details(client, place_name: str):
+    """Gets the name, address, and coordinates for the best match of a place name."""
+    field_mask = PLACES_FIELD_MASK
+    request = SearchTextRequest(
+        text_query = place_name,
+    )
+    response = client.search_text( request=request, metadata=[('x-goog-fieldmask', field_mask)] )
+    if response and response.places:
+        info = response.places[0]
+        name = info.display_name.text
+        address = info.formatted_address
+        location = info.location
+        latitude = location.latitude
+        longitude = location.longitude
+
+        return {
+            "name": name,
+            "address": address,
+            "location": {
+                "latitude": latitude,
+                "longitude": longitude,
             }
+        }
+
+    return None
+
+def lookup_place(place_name: str):
+    """
+    Looks up one place, using the geocode cache if we have seen it before.
+    Retries once with the latest key if the key was rejected.
+    """
+    found, details = geocode_cache.get(place_name, PLACES_FIELD_MASK)
+    if found:
+        return details
 
-        return None
+    try:
+        details = get_details(get_places_client(get_api_key()), place_name)
+    except GoogleAPICallError as e:
+        if not places_key_rejected(e):
+            raise
+        # The key may have been rotated, so get the latest one and try again
+        invalidate_secret(PROJECT_ID, SECRET_ID)
+        details = get_details(get_places_client(get_api_key()), place_name)
 
-    details1 = get_details(place1)
-    details2 = get_details(place2)
+    geocode_cache.put(place_name, PLACES_FIELD_MASK, details)
+    return details
+
+def lookup_places(places: list[str]):
+    """
+    Looks up several places at the same time.
+    Returns a (details, error) pair for each place, in the same order as places.
+    """
+    futures = [places_executor.submit(lookup_place, place_name) for place_name in places]
+    results = []
+    for future in futures:
+        try:
+            results.append((future.result(), None))
+        except Exception as e:
+            results.append((None, e))
+    return results
+
+def get_places_details(places: list[str]):
+    """Gets the address and coordinates for each place in a list of places."""
+    results = []
+    for place_name, (details, error) in zip(places, lookup_places(places)):
+        if error is not None:
+            results.append({"query": place_name, "error": str(error)})
+        else:
+            results.append({"query": place_name, "details": details})
+
+    return {"places": results}
+
+def get_place_details(place1: str, place2: str):
+    """Gets the address and coordinates for two places."""
+    (details1, error1), (details2, error2) = lookup_places([place1, place2])
+    for error in (error1, error2):
+        if error is not None:
+            raise error
 
     return {"place1": details1, "place2": details2}
 
-def get_route_between_places(location1: dict, location2: dict):
-    """Gets the distance and duration of the route between two places."""
-    api_key = get_api_key()
-    headers = {
-        "Content-Type": "application/json",
-        "X-Goog-Api-Key": api_key,
-        "X-Goog-FieldMask": "routes.distanceMeters,routes.duration",
-    }
+def post_routes_request(url: str, headers: dict, request_body: dict, stream: bool = False):
+    """Sends a request to the Routes API, retrying once with the latest key if the key was rejected."""
+    response = http_post(
+        url=url,
+        headers=headers,
+        json=request_body,
+        stream=stream,
+    )
+    if key_rejected(response):
+        # The key may have been rotated, so get the latest one and try again
+        response.close()
+        invalidate_secret(PROJECT_ID, SECRET_ID)
+        headers["X-Goog-Api-Key"] = get_api_key()
+        response = http_post(
+            url=url,
+            headers=headers,
+            json=request_body,
+            stream=stream,
+        )
+    response.raise_for_status()  # Raise an exception for HTTP errors
+    return response
 
-    request_body = {
+def route_request_body(location1: dict, location2: dict):
+    """Builds the computeRoutes request for the route between two locations."""
+    return {
         "origin": {
             "location": {
                 "latLng": {
@@ -78,19 +155,11 @@ def get_route_between_places(location1: dict, location2: dict):
                 }
             }
         },
-        "travelMode": "DRIVE",
+        "travelMode": TRAVEL_MODE,
     }
 
-    url = "https://routes.googleapis.com/directions/v2:computeRoutes"
-
-    response = requests.post(
-        url=url,
-        headers=headers,
-        json=request_body,
-    )
-    response.raise_for_status()  # Raise an exception for HTTP errors
-    routes_data = response.json()
-
+def to_route(routes_data: dict):
+    """Gets the distance and duration of the first route in a computeRoutes response."""
     if routes_data and "routes" in routes_data and routes_data["routes"]:
         route = routes_data["routes"][0]
         return {
@@ -99,3 +168,199 @@ def get_route_between_places(location1: dict, location2: dict):
         }
 
     return None
+
+def get_route_between_places(location1: dict, location2: dict):
+    """Gets the distance and duration of the route between two places."""
+    found, route = route_cache.get(location1, location2, TRAVEL_MODE)
+    if found:
+        return route
+
+    headers = {
+        "Content-Type": "application/json",
+        "X-Goog-Api-Key": get_api_key(),
+        "X-Goog-FieldMask": "routes.distanceMeters,routes.duration",
+    }
+
+    request_body = route_request_body(location1, location2)
+
+    response = post_routes_request(ROUTES_URL, headers, request_body)
+    route = to_route(response.json())
+
+    route_cache.put(location1, location2, TRAVEL_MODE, route)
+    return route
+
+# The Routes API limits how many origin-destination pairs (elements) a
+# single route matrix request may contain
+ROUTE_MATRIX_MAX_ELEMENTS = 625
+
+ROUTE_MATRIX_URL = f"{ROUTES_API_BASE_URL}/distanceMatrix/v2:computeRouteMatrix"
+ROUTE_MATRIX_FIELD_MASK = "originIndex,destinationIndex,status,condition,distanceMeters,duration"
+
+def to_waypoint(location: dict):
+    """Converts a {"latitude", "longitude"} location to a Routes API waypoint."""
+    return {
+        "waypoint": {
+            "location": {
+                "latLng": {
+                    "latitude": location["latitude"],
+                    "longitude": location["longitude"],
+                }
+            }
+        }
+    }
+
+def decode_json_array_items(buffer: str):
+    """
+    Decodes the complete items at the start of a partially received JSON array.
+    Returns the items and the rest of the buffer, which is still incomplete.
+    """
+    decoder = json.JSONDecoder()
+    items = []
+    position = 0
+    while True:
+        # Skip the whitespace and punctuation between the array items
+        while position < len(buffer) and buffer[position] in " \t\r\n[,]":
+            position += 1
+        if position == len(buffer):
+            break
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The rest of this item has not arrived yet
+            break
+        items.append(item)
+    return items, buffer[position:]
+
+def iter_json_array(text_chunks):
+    """Yields each item of a JSON array as soon as it has been completely received."""
+    buffer = ""
+    for text in text_chunks:
+        items, buffer = decode_json_array_items(buffer + text)
+        yield from items
+
+def to_matrix_result(element: dict, origin_start: int = 0, destination_start: int = 0):
+    """Converts a route matrix element from the API into a route matrix result."""
+    # Indexes of 0 are left out of the response
+    result = {
+        "origin_index": origin_start + element.get("originIndex", 0),
+        "destination_index": destination_start + element.get("destinationIndex", 0),
+    }
+    if element.get("condition") == "ROUTE_EXISTS":
+        result["distance_meters"] = element.get("distanceMeters", 0)
+        result["duration_seconds"] = int(element["duration"].replace("s", ""))
+    else:
+        status = element.get("status", {})
+        result["error"] = status.get("message") or element.get("condition", "ROUTE_NOT_FOUND")
+    return result
+
+def route_matrix_batches(origins: list[dict], destinations: list[dict]):
+    """
+    Splits the pairs into as few route matrix requests as the API allows.
+    Yields the request body and the index of its first origin and destination.
+    """
+    destinations_per_request = min(len(destinations), ROUTE_MATRIX_MAX_ELEMENTS)
+    origins_per_request = max(1, ROUTE_MATRIX_MAX_ELEMENTS // max(1, destinations_per_request))
+    for origin_start in range(0, len(origins), origins_per_request):
+        origin_batch = origins[origin_start:origin_start + origins_per_request]
+        for destination_start in range(0, len(destinations), destinations_per_request):
+            destination_batch = destinations[destination_start:destination_start + destinations_per_request]
+            request_body = {
+                "origins": [to_waypoint(location) for location in origin_batch],
+                "destinations": [to_waypoint(location) for location in destination_batch],
+                "travelMode": TRAVEL_MODE,
+            }
+            yield request_body, origin_start, destination_start
+
+def request_route_matrix(origins: list[dict], destinations: list[dict]):
+    """Yields the route between each origin and destination as the results arrive."""
+    headers = {
+        "Content-Type": "application/json",
+        "X-Goog-Api-Key": get_api_key(),
+        "X-Goog-FieldMask": ROUTE_MATRIX_FIELD_MASK,
+    }
+
+    for request_body, origin_start, destination_start in route_matrix_batches(origins, destinations):
+        with post_routes_request(ROUTE_MATRIX_URL, headers, request_body, stream=True) as response:
+            elements = iter_json_array(response.iter_content(chunk_size=None, decode_unicode=True))
+            for element in elements:
+                yield to_matrix_result(element, origin_start, destination_start)
+
+def matrix_result(origin_index: int, destination_index: int, route):
+    """Formats a route (or None if there is no route) as a route matrix result."""
+    result = {"origin_index": origin_index, "destination_index": destination_index}
+    if route:
+        result.update(route)
+    else:
+        result["error"] = "ROUTE_NOT_FOUND"
+    return result
+
+def split_cached_routes(origins: list[dict], destinations: list[dict]):
+    """
+    Looks up every origin-destination pair in the route cache.
+    Returns the results for the cached pairs and the set of pairs that are missing.
+    """
+    cached = []
+    missing = set()
+    for origin_index, origin in enumerate(origins):
+        for destination_index, destination in enumerate(destinations):
+            found, route = route_cache.get(origin, destination, TRAVEL_MODE)
+            if found:
+                cached.append(matrix_result(origin_index, destination_index, route))
+            else:
+                missing.add((origin_index, destination_index))
+    return cached, missing
+
+def missing_route_indexes(missing: set):
+    """Returns the origin and destination indexes that still have a missing route."""
+    origin_indexes = sorted({origin_index for origin_index, _ in missing})
+    destination_indexes = sorted({destination_index for _, destination_index in missing})
+    return origin_indexes, destination_indexes
+
+def remember_matrix_result(result: dict, origins: list[dict], destinations: list[dict], origin_indexes: list[int], destination_indexes: list[int]):
+    """Maps a result for the missing routes back to the full matrix and caches its route."""
+    origin_index = origin_indexes[result["origin_index"]]
+    destination_index = destination_indexes[result["destination_index"]]
+    result["origin_index"] = origin_index
+    result["destination_index"] = destination_index
+    if "error" not in result:
+        route = {
+            "distance_meters": result["distance_meters"],
+            "duration_seconds": result["duration_seconds"],
+        }
+        route_cache.put(origins[origin_index], destinations[destination_index], TRAVEL_MODE, route)
+    return result
+
+def iter_route_matrix(origins: list[dict], destinations: list[dict]):
+    """
+    Yields the route between each origin and destination.
+    Cached routes are yielded first, then the rest as they arrive from the API.
+    """
+    cached, missing = split_cached_routes(origins, destinations)
+    yield from cached
+    if not missing:
+        return
+
+    # Only request the origins and destinations that still have a missing route
+    origin_indexes, destination_indexes = missing_route_indexes(missing)
+    results = request_route_matrix(
+        [origins[origin_index] for origin_index in origin_indexes],
+        [destinations[destination_index] for destination_index in destination_indexes],
+    )
+    for result in results:
+        result = remember_matrix_result(result, origins, destinations, origin_indexes, destination_indexes)
+        if (result["origin_index"], result["destination_index"]) in missing:
+            yield result
+
+def get_route_matrix(origins: list[dict], destinations: list[dict]):
+    """
+    Gets the distance and duration of the routes from each origin to each destination.
+    The agent needs the whole matrix in one tool result, so this collects every route before returning.
+    Use iter_route_matrix() to handle each route as soon as it arrives.
+    """
+    if len(origins) == 1 and len(destinations) == 1:
+        route = get_route_between_places(origins[0], destinations[0])
+        return {"routes": [matrix_result(0, 0, route)]}
+
+    routes = list(iter_route_matrix(origins, destinations))
+    routes.sort(key=lambda route: (route["origin_index"], route["destination_index"]))
+    return {"routes": routes}
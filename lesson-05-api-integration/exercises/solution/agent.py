@@ -1,6 +1,11 @@
 import os
 from google.adk.agents import Agent
-from .tools import convert_currency
+
+# Set USE_ASYNC_TOOLS to register the async (non-blocking) version of the tool
+if os.environ.get("USE_ASYNC_TOOLS", "").lower() in ("1", "true", "yes"):
+    from .async_tools import convert_currency
+else:
+    from .tools import convert_currency
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 instruction_file_path = os.path.join(script_dir, "agent-prompt.txt")
@@ -0,0 +1,51 @@
+import asyncio
+from .http_transport import http_get_async
+from .secret_cache import get_secret_async, invalidate_secret, key_rejected
+from .tools import EXCHANGE_RATE_API_BASE_URL, EXCHANGE_RATE_MODE, PROJECT_ID, SECRET_ID, rates_table
+
+# Async versions of the tools in tools.py.
+#
+# The tools in tools.py wait on the network, which blocks the event loop
+# that the ADK runner uses for every session in this process. These versions
+# have the same names, parameters, and return values, but use an async HTTP
+# client, so other sessions keep running while a tool waits for a response.
+#
+# agent.py registers these instead of the ones in tools.py when
+# USE_ASYNC_TOOLS is set.
+
+async def get_api_key():
+    """Gets the API key from Secret Manager, using the shared secret cache."""
+    return await get_secret_async(PROJECT_ID, SECRET_ID)
+
+async def get_with_api_key(path: str):
+    """Makes a GET request to the API, retrying once with the latest key if the key was rejected."""
+    api_key = await get_api_key()
+    url = f"{EXCHANGE_RATE_API_BASE_URL}/{api_key}/{path}"
+    response = await http_get_async(url)
+    if key_rejected(response):
+        # The key may have been rotated, so get the latest one and try again
+        await response.aclose()
+        invalidate_secret(PROJECT_ID, SECRET_ID)
+        api_key = await get_api_key()
+        url = f"{EXCHANGE_RATE_API_BASE_URL}/{api_key}/{path}"
+        response = await http_get_async(url)
+    response.raise_for_status()  # Raise an exception for HTTP errors
+    return response
+
+async def convert_currency(source_currency: str, target_currency: str, amount: float):
+    """Converts an amount from one currency to another."""
+    if EXCHANGE_RATE_MODE == "table":
+        if rates_table.is_fresh():
+            converted_amount = rates_table.convert(source_currency, target_currency, amount)
+        else:
+            # Fetching the rates blocks, so do it in a worker thread
+            converted_amount = await asyncio.to_thread(rates_table.convert, source_currency, target_currency, amount)
+        return {"converted_amount": float(converted_amount)}
+
+    response = await get_with_api_key(f"pair/{source_currency}/{target_currency}/{amount}")
+    data = response.json()
+
+    if data and "conversion_result" in data:
+        return {"converted_amount": data["conversion_result"]}
+
+    return None
@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+from decimal import Decimal
+
+# A local table of exchange rates.
+#
+# Instead of asking the exchange rate API for every conversion, we fetch the
+# latest rates for one base currency and convert between any two currencies
+# ourselves. If the base is USD, converting EUR to JPY uses the cross rate
+# (USD->JPY) / (USD->EUR). All the math is done with Decimal so we don't pick
+# up floating point rounding errors.
+#
+# The table is kept for a limited time (its TTL). Shortly before it expires,
+# the next conversion starts a refresh in a background thread and keeps using
+# the current rates, so conversions almost never wait on the network.
+
+EXCHANGE_RATE_TTL_SECONDS = float(os.environ.get("EXCHANGE_RATE_TTL_SECONDS", "3600"))
+EXCHANGE_RATE_REFRESH_AHEAD_SECONDS = float(os.environ.get("EXCHANGE_RATE_REFRESH_AHEAD_SECONDS", "300"))
+
+# Conversions are rounded to this many places, like the API's pair endpoint
+CONVERSION_PLACES = Decimal("0.0001")
+
+
+class RatesTable:
+    """Converts currencies locally using a periodically refreshed rates table."""
+
+    def __init__(
+        self,
+        fetch_rates,
+        ttl_seconds: float = EXCHANGE_RATE_TTL_SECONDS,
+        refresh_ahead_seconds: float = EXCHANGE_RATE_REFRESH_AHEAD_SECONDS,
+    ):
+        # fetch_rates() returns a dict of currency code to Decimal rate
+        # relative to the base currency
+        self._fetch_rates = fetch_rates
+        self.ttl_seconds = ttl_seconds
+        self.refresh_ahead_seconds = refresh_ahead_seconds
+        self._rates = None
+        self._expires_at = 0.0
+        self._fetch_lock = threading.Lock()
+
+    def _fetch(self) -> dict:
+        rates = {code.upper(): Decimal(rate) for code, rate in self._fetch_rates().items()}
+        self._rates = rates
+        self._expires_at = time.monotonic() + self.ttl_seconds
+        return rates
+
+    def _refresh_in_background(self):
+        if not self._fetch_lock.acquire(blocking=False):
+            # Someone is already refreshing the table
+            return
+
+        def refresh():
+            try:
+                self._fetch()
+            except Exception as e:
+                # Keep using the current rates until they expire
+                print(f"Unable to refresh exchange rates: {e}")
+            finally:
+                self._fetch_lock.release()
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def is_fresh(self) -> bool:
+        """Returns True if conversions can be done without waiting for new rates."""
+        return self._rates is not None and self._expires_at > time.monotonic()
+
+    def rates(self) -> dict:
+        """Returns the current rates, fetching them only when needed."""
+        rates = self._rates
+        remaining = self._expires_at - time.monotonic()
+        if rates is not None and remaining > 0:
+            if remaining < self.refresh_ahead_seconds:
+                self._refresh_in_background()
+            return rates
+
+        with self._fetch_lock:
+            # Another thread may have fetched them while we were waiting
+            if self._rates is not None and self._expires_at > time.monotonic():
+                return self._rates
+            return self._fetch()
+
+    def rate(self, source_currency: str, target_currency: str) -> Decimal:
+        """Returns how much one unit of the source currency is worth in the target currency."""
+        rates = self.rates()
+        source = source_currency.upper()
+        target = target_currency.upper()
+        for code in (source, target):
+            if code not in rates:
+                raise ValueError(f"Unsupported currency code: {code}")
+        return rates[target] / rates[source]
+
+    def convert(self, source_currency: str, target_currency: str, amount) -> Decimal:
+        """Converts an amount from one currency to another."""
+        converted = Decimal(str(amount)) * self.rate(source_currency, target_currency)
+        return converted.quantize(CONVERSION_PLACES)
@@ -1,23 +1,52 @@
 import os
-from google.cloud import secretmanager
-import requests
+from decimal import Decimal
+from .http_transport import http_get
+from .rates_table import RatesTable
+from .secret_cache import get_secret, invalidate_secret, key_rejected
 
 PROJECT_ID = os.environ.get("GOOGLE_CLOUD_PROJECT")
 SECRET_ID = "exchangerate-api-key"
 
+# "pair" asks the API for every conversion, while "table" converts locally
+# using the latest rates for EXCHANGE_RATE_BASE (see rates_table.py)
+EXCHANGE_RATE_MODE = os.environ.get("EXCHANGE_RATE_MODE", "pair")
+EXCHANGE_RATE_BASE = os.environ.get("EXCHANGE_RATE_BASE", "USD")
+EXCHANGE_RATE_API_BASE_URL = os.environ.get("EXCHANGE_RATE_API_BASE_URL", "https://v6.exchangerate-api.com/v6")
+
 def get_api_key():
-    """Gets the API key from Secret Manager."""
-    client = secretmanager.SecretManagerServiceClient()
-    name = f"projects/{PROJECT_ID}/secrets/{SECRET_ID}/versions/latest"
-    response = client.access_secret_version(name=name)
-    return response.payload.data.decode("UTF-8")
+    """Gets the API key from Secret Manager, using the shared secret cache."""
+    return get_secret(PROJECT_ID, SECRET_ID)
 
-def convert_currency(source_currency: str, target_currency: str, amount: float):
-    """Converts an amount from one currency to another."""
+def get_with_api_key(path: str):
+    """Makes a GET request to the API, retrying once with the latest key if the key was rejected."""
     api_key = get_api_key()
-    url = f"https://v6.exchangerate-api.com/v6/{api_key}/pair/{source_currency}/{target_currency}/{amount}"
-    response = requests.get(url)
+    url = f"{EXCHANGE_RATE_API_BASE_URL}/{api_key}/{path}"
+    response = http_get(url)
+    if key_rejected(response):
+        # The key may have been rotated, so get the latest one and try again
+        response.close()
+        invalidate_secret(PROJECT_ID, SECRET_ID)
+        api_key = get_api_key()
+        url = f"{EXCHANGE_RATE_API_BASE_URL}/{api_key}/{path}"
+        response = http_get(url)
     response.raise_for_status()  # Raise an exception for HTTP errors
+    return response
+
+def get_latest_rates(base_currency: str):
+    """Gets the latest exchange rates from a base currency to every supported currency."""
+    response = get_with_api_key(f"latest/{base_currency}")
+    data = response.json(parse_float=Decimal)
+    return data["conversion_rates"]
+
+rates_table = RatesTable(lambda: get_latest_rates(EXCHANGE_RATE_BASE))
+
+def convert_currency(source_currency: str, target_currency: str, amount: float):
+    """Converts an amount from one currency to another."""
+    if EXCHANGE_RATE_MODE == "table":
+        converted_amount = rates_table.convert(source_currency, target_currency, amount)
+        return {"converted_amount": float(converted_amount)}
+
+    response = get_with_api_key(f"pair/{source_currency}/{target_currency}/{amount}")
     data = response.json()
 
     if data and "conversion_result" in data:
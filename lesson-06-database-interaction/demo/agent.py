@@ -1,6 +1,12 @@
 import os
 from google.adk.agents import Agent
-from toolbox_core import ToolboxSyncClient
+
+# Set USE_ASYNC_TOOLS to call the tools with the async (non-blocking) Toolbox client
+USE_ASYNC_TOOLS = os.environ.get("USE_ASYNC_TOOLS", "").lower() in ("1", "true", "yes")
+if USE_ASYNC_TOOLS:
+    from .async_toolbox_tools import AsyncToolboxToolset, load_async_toolbox_tools as load_toolbox_tools
+else:
+    from .toolbox_tools import load_toolbox_tools
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 instruction_file_path = os.path.join(script_dir, "agent-prompt.txt")
@@ -12,16 +18,18 @@ model = "gemini-2.5-flash"
 # Set up the tools that we will be using for the root agent
 toolbox_url = os.environ.get("TOOLBOX_URL", "http://127.0.0.1:5000")
 print(f"Connecting to Toolbox at {toolbox_url}")
-db_client = ToolboxSyncClient( toolbox_url )
-tools=[
-    db_client.load_tool("books-by-author"),
-    db_client.load_tool("books-in-year-range"),
-]
+# The tools load in the background, so starting the agent doesn't wait
+# for the Toolbox server
+tools = load_toolbox_tools(toolbox_url, [
+    "books-by-author",
+    "books-in-year-range",
+])
 
 root_agent = Agent(
     name="book_database_agent",
     description="An agent that can access a database about books and authors.",
     instruction=instruction,
     model=model,
-    tools=tools
+    # The toolset closes the async client's connections when the runner shuts down
+    tools=[AsyncToolboxToolset(tools)] if USE_ASYNC_TOOLS else tools
 )
@@ -0,0 +1,48 @@
+import json
+import sys
+from google.adk.tools import FunctionTool
+from .agent import tools
+from .async_toolbox_tools import load_async_toolbox_tools
+from .toolbox_tools import load_toolbox_tools
+
+# Checks that the agent describes each Toolbox tool to the model in the same
+# way whether USE_ASYNC_TOOLS is set or not, and that every tool has a
+# description. The schemas come from the saved manifest if there is one, so
+# run the agent once first, or have the Toolbox server running. From the
+# lesson directory:
+#   python -m demo.check_tool_declarations
+
+
+def declaration(tool) -> dict:
+    """Gets the function declaration the agent sends to the model for a tool."""
+    return FunctionTool(tool)._get_declaration().model_dump(mode="json", exclude_none=True)
+
+
+def main():
+    url = tools[0]._loader.url
+    names = [tool.__name__ for tool in tools]
+    problems = []
+    for name, sync_tool, async_tool in zip(names, load_toolbox_tools(url, names), load_async_toolbox_tools(url, names)):
+        try:
+            sync_declaration = declaration(sync_tool)
+            async_declaration = declaration(async_tool)
+        except Exception as e:
+            problems.append(f"Could not get the schema of {name}, is the Toolbox server running? {e}")
+            continue
+        if not sync_declaration.get("description"):
+            problems.append(f"{name} has no description")
+        if sync_declaration != async_declaration:
+            problems.append(
+                f"{name} is described differently by the async tools:\n"
+                f"  sync:  {json.dumps(sync_declaration)}\n"
+                f"  async: {json.dumps(async_declaration)}"
+            )
+
+    for problem in problems:
+        print(problem)
+    print(f"Checked {len(names)} tools, found {len(problems)} problems")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
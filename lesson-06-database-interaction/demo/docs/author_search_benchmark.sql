@@ -0,0 +1,159 @@
+-- Compares the books-by-author search with and without author_name_suffixes
+-- on a large made-up catalog.
+--
+-- The old statement filtered with LOWER(a.name) LIKE CONCAT('%', LOWER(?), '%'),
+-- which has to check the name of every author. The new one finds the
+-- matching authors with a range scan of the suffix index instead. Both find
+-- the same books.
+--
+-- This creates (and replaces) a separate author_search_benchmark database,
+-- so the demo database isn't changed. Run it with the mysql client, for
+-- example:
+--   mysql -h <MYSQL_HOST> -u root -p < docs/author_search_benchmark.sql
+-- Change @authors below to try a larger or smaller catalog.
+
+SET @authors = 200000;
+
+DROP DATABASE IF EXISTS author_search_benchmark;
+CREATE DATABASE author_search_benchmark;
+USE author_search_benchmark;
+
+-- The same tables as demo_database.sql
+CREATE TABLE authors (
+    author_id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    birth_year INT
+);
+
+CREATE TABLE books (
+    book_id INT AUTO_INCREMENT PRIMARY KEY,
+    title VARCHAR(255) NOT NULL,
+    author_id INT NOT NULL,
+    publication_year INT,
+    FOREIGN KEY (author_id) REFERENCES authors(author_id)
+);
+
+CREATE TABLE author_name_suffixes (
+    suffix VARCHAR(255) NOT NULL,
+    author_id INT NOT NULL,
+    PRIMARY KEY (suffix, author_id),
+    FOREIGN KEY (author_id) REFERENCES authors(author_id) ON DELETE CASCADE
+);
+
+-- Made-up authors, each with one of 20 first names, one of 25 surnames, and
+-- a number, so every name is different
+INSERT INTO authors (name, birth_year)
+WITH digits (d) AS (
+    SELECT 0 UNION ALL SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3 UNION ALL SELECT 4
+    UNION ALL SELECT 5 UNION ALL SELECT 6 UNION ALL SELECT 7 UNION ALL SELECT 8 UNION ALL SELECT 9
+),
+numbers (n) AS (
+    SELECT d1.d + d2.d * 10 + d3.d * 100 + d4.d * 1000 + d5.d * 10000 + d6.d * 100000 + d7.d * 1000000
+    FROM digits d1, digits d2, digits d3, digits d4, digits d5, digits d6, digits d7
+)
+SELECT
+    CONCAT_WS(' ',
+        ELT(1 + n MOD 20,
+            'Ada', 'Bram', 'Charlotte', 'Daniel', 'Emily', 'Franz', 'Gabriel', 'Herman',
+            'Isabel', 'Jules', 'Kazuo', 'Louisa', 'Miguel', 'Nadine', 'Octavia', 'Pablo',
+            'Rainer', 'Sylvia', 'Ursula', 'Wole'),
+        ELT(1 + (n DIV 20) MOD 25,
+            'Achebe', 'Baldwin', 'Bronte', 'Calvino', 'Dickens', 'Eco', 'Flaubert', 'Garcia',
+            'Hugo', 'Ishiguro', 'Joyce', 'Kafka', 'Le Guin', 'Mann', 'Neruda', 'Okri',
+            'Plath', 'Rilke', 'Stoker', 'Tolkien', 'Undset', 'Verne', 'Wilde', 'Yeats', 'Zola'),
+        n),
+    1700 + n MOD 300
+FROM numbers
+WHERE n < @authors;
+
+INSERT INTO books (title, author_id, publication_year)
+SELECT CONCAT('Volume ', copies.volume, ' by ', a.name), a.author_id, a.birth_year + 20 + copies.volume * 5
+FROM authors a
+CROSS JOIN (SELECT 1 AS volume UNION ALL SELECT 2 UNION ALL SELECT 3) copies;
+
+-- The triggers in demo_database.sql add suffixes one author at a time, so
+-- for a bulk load we add them all at once instead
+INSERT INTO author_name_suffixes (suffix, author_id)
+WITH RECURSIVE starts (start_at) AS (
+    SELECT 1
+    UNION ALL
+    SELECT start_at + 1 FROM starts WHERE start_at < 255
+)
+SELECT LOWER(SUBSTRING(a.name, starts.start_at)), a.author_id
+FROM authors a
+JOIN starts ON starts.start_at <= CHAR_LENGTH(a.name);
+
+ANALYZE TABLE authors, books, author_name_suffixes;
+
+-- Runs both versions of the search p_runs times, and reports how many books
+-- each found and their average time
+DELIMITER //
+CREATE PROCEDURE compare_author_search(IN p_author VARCHAR(255), IN p_runs INT)
+BEGIN
+    DECLARE run INT DEFAULT 0;
+    DECLARE started DATETIME(6);
+    DECLARE like_books INT;
+    DECLARE suffix_books INT;
+    DECLARE like_us BIGINT DEFAULT 0;
+    DECLARE suffix_us BIGINT DEFAULT 0;
+
+    WHILE run < p_runs DO
+        SET started = NOW(6);
+        SELECT COUNT(*) INTO like_books
+        FROM books b
+        JOIN authors a ON b.author_id = a.author_id
+        WHERE LOWER(a.name) LIKE CONCAT('%', LOWER(p_author), '%');
+        SET like_us = like_us + TIMESTAMPDIFF(MICROSECOND, started, NOW(6));
+
+        SET started = NOW(6);
+        SELECT COUNT(*) INTO suffix_books
+        FROM books b
+        JOIN authors a ON b.author_id = a.author_id
+        WHERE a.author_id IN (
+            SELECT s.author_id
+            FROM author_name_suffixes s
+            WHERE s.suffix LIKE CONCAT(LOWER(p_author), '%')
+        );
+        SET suffix_us = suffix_us + TIMESTAMPDIFF(MICROSECOND, started, NOW(6));
+
+        SET run = run + 1;
+    END WHILE;
+
+    SELECT
+        p_author AS author,
+        like_books,
+        ROUND(like_us / p_runs / 1000, 2) AS like_ms,
+        suffix_books,
+        ROUND(suffix_us / p_runs / 1000, 2) AS suffix_ms;
+END //
+DELIMITER ;
+
+-- A single author, a short part of a name, a common surname, a first name
+-- and surname, and a name that doesn't exist
+CALL compare_author_search('Tolkien 123459', 10);
+CALL compare_author_search('kien 1234', 10);
+CALL compare_author_search('Le Guin', 10);
+CALL compare_author_search('ursula le guin', 10);
+CALL compare_author_search('Nobody Atall', 10);
+
+-- The plans, with actual row counts and times, of the statement the
+-- books-by-author tool runs, before and after
+SET @author = 'Tolkien 123459';
+
+EXPLAIN ANALYZE
+SELECT b.title, a.name AS author_name, b.publication_year
+FROM books b
+JOIN authors a ON b.author_id = a.author_id
+WHERE LOWER(a.name) LIKE CONCAT('%', LOWER(@author), '%')
+ORDER BY b.title;
+
+EXPLAIN ANALYZE
+SELECT b.title, a.name AS author_name, b.publication_year
+FROM books b
+JOIN authors a ON b.author_id = a.author_id
+WHERE a.author_id IN (
+    SELECT s.author_id
+    FROM author_name_suffixes s
+    WHERE s.suffix LIKE CONCAT(LOWER(@author), '%')
+)
+ORDER BY b.title;
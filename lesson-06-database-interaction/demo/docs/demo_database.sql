@@ -18,6 +18,49 @@ CREATE TABLE IF NOT EXISTS books (
     FOREIGN KEY (author_id) REFERENCES authors(author_id)
 );
 
+-- Create a table with every ending ("suffix") of every author's name, in
+-- lowercase. A name contains some text exactly when one of its suffixes
+-- starts with that text, so searching for part of a name can use the index
+-- on suffix, instead of checking the name of every author.
+CREATE TABLE IF NOT EXISTS author_name_suffixes (
+    suffix VARCHAR(255) NOT NULL,
+    author_id INT NOT NULL,
+    PRIMARY KEY (suffix, author_id),
+    FOREIGN KEY (author_id) REFERENCES authors(author_id) ON DELETE CASCADE
+);
+
+-- Keep the suffixes up to date as authors are added and renamed
+DROP PROCEDURE IF EXISTS index_author_name;
+DROP TRIGGER IF EXISTS authors_after_insert;
+DROP TRIGGER IF EXISTS authors_after_update;
+
+DELIMITER //
+CREATE PROCEDURE index_author_name(IN p_author_id INT, IN p_name VARCHAR(255))
+BEGIN
+    DECLARE start_at INT DEFAULT 1;
+    DELETE FROM author_name_suffixes WHERE author_id = p_author_id;
+    WHILE start_at <= CHAR_LENGTH(p_name) DO
+        INSERT INTO author_name_suffixes (suffix, author_id)
+        VALUES (LOWER(SUBSTRING(p_name, start_at)), p_author_id);
+        SET start_at = start_at + 1;
+    END WHILE;
+END //
+
+CREATE TRIGGER authors_after_insert AFTER INSERT ON authors
+FOR EACH ROW
+BEGIN
+    CALL index_author_name(NEW.author_id, NEW.name);
+END //
+
+CREATE TRIGGER authors_after_update AFTER UPDATE ON authors
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.name <=> OLD.name) THEN
+        CALL index_author_name(NEW.author_id, NEW.name);
+    END IF;
+END //
+DELIMITER ;
+
 -- Insert sample data into authors table
 INSERT INTO authors (name, birth_year) VALUES
     ('J.R.R. Tolkien', 1892),
@@ -70,3 +113,15 @@ INSERT INTO books (title, author_id, publication_year) VALUES
     ('Beloved', 19, 1987),
     ('The Color Purple', 20, 1982),
     ('I Know Why the Caged Bird Sings', 21, 1969);
+
+-- Add the suffixes of any authors that were added before the triggers
+-- existed
+INSERT IGNORE INTO author_name_suffixes (suffix, author_id)
+WITH RECURSIVE starts (start_at) AS (
+    SELECT 1
+    UNION ALL
+    SELECT start_at + 1 FROM starts WHERE start_at < 255
+)
+SELECT LOWER(SUBSTRING(a.name, starts.start_at)), a.author_id
+FROM authors a
+JOIN starts ON starts.start_at <= CHAR_LENGTH(a.name);
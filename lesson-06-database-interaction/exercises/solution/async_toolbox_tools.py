@@ -0,0 +1,141 @@
+import asyncio
+import os
+import threading
+import weakref
+from aiohttp import ClientError, ClientSession, TCPConnector
+from google.adk.tools import FunctionTool
+from google.adk.tools.base_toolset import BaseToolset
+from toolbox_core import ToolboxClient
+from .toolbox_tools import TOOLBOX_LOAD_TIMEOUT_SECONDS, LazyToolboxTool, load_toolbox_tools
+
+# Async versions of the Toolbox tools in toolbox_tools.py.
+#
+# The tools from ToolboxSyncClient block the event loop that the ADK runner
+# uses for every session in this process while they wait for the database,
+# so when the model asks for several tools at once they run one after
+# another. These versions call the same tools through the async
+# ToolboxClient, so the runner can run them at the same time, and other
+# sessions keep running while they wait.
+#
+# All the tools share one client for each event loop, and its connection
+# pool is limited to TOOLBOX_MAX_CONNECTIONS, so a burst of calls can't open
+# more connections than the Toolbox server (and the database behind it) can
+# handle. Each call is limited to a timeout, which can be set for each tool.
+#
+# agent.py uses these instead of the ones in toolbox_tools.py when
+# USE_ASYNC_TOOLS is set. It hands them to the agent in an
+# AsyncToolboxToolset, because the ADK runner calls close() on every toolset
+# when it shuts down, which is when the clients' connections are closed.
+
+TOOLBOX_MAX_CONNECTIONS = int(os.environ.get("TOOLBOX_MAX_CONNECTIONS", "16"))
+TOOLBOX_TIMEOUT_SECONDS = float(os.environ.get("TOOLBOX_TIMEOUT_SECONDS", "30"))
+
+
+def parse_tool_timeouts(value: str) -> dict:
+    """Parses per-tool timeouts, written as "tool-name=seconds,other-tool=seconds"."""
+    timeouts = {}
+    for item in value.split(","):
+        if item.strip():
+            name, seconds = item.split("=", 1)
+            timeouts[name.strip()] = float(seconds)
+    return timeouts
+
+
+# For example: TOOLBOX_TOOL_TIMEOUTS=get_product=5,update_product_stock=10
+TOOLBOX_TOOL_TIMEOUTS = parse_tool_timeouts(os.environ.get("TOOLBOX_TOOL_TIMEOUTS", ""))
+
+
+def tool_timeout(name: str) -> float:
+    return TOOLBOX_TOOL_TIMEOUTS.get(name, TOOLBOX_TIMEOUT_SECONDS)
+
+
+# Async clients are tied to the event loop they were created in, so we keep
+# one client for each Toolbox URL (with the session it uses), and the tools
+# loaded from it, for each running loop
+_async_clients = weakref.WeakKeyDictionary()
+_async_tools = weakref.WeakKeyDictionary()
+_async_clients_lock = threading.Lock()
+
+
+async def close_async_toolbox_clients():
+    """Closes the shared Toolbox clients, and their connections, for the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        clients = _async_clients.pop(loop, {})
+        _async_tools.pop(loop, None)
+    for client, session in clients.values():
+        # ToolboxClient leaves a session it was given open, so we close it ourselves
+        await client.close()
+        await session.close()
+
+
+def get_async_toolbox_client(url: str) -> ToolboxClient:
+    """Gets the shared ToolboxClient for a URL in the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        if url not in clients:
+            session = ClientSession(connector=TCPConnector(limit=TOOLBOX_MAX_CONNECTIONS))
+            clients[url] = (ToolboxClient(url, session=session), session)
+        client, _ = clients[url]
+    return client
+
+
+async def get_async_tool(url: str, name: str):
+    """Gets a tool for the running event loop, loading it from the server the first time."""
+    loop = asyncio.get_running_loop()
+    client = get_async_toolbox_client(url)
+    with _async_clients_lock:
+        tools = _async_tools.setdefault(loop, {})
+        task = tools.get((url, name))
+        if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+            # Concurrent first calls share one load
+            task = loop.create_task(client.load_tool(name))
+            tools[(url, name)] = task
+    return await asyncio.wait_for(asyncio.shield(task), timeout=TOOLBOX_LOAD_TIMEOUT_SECONDS)
+
+
+class AsyncLazyToolboxTool(LazyToolboxTool):
+    # The same stand-in as LazyToolboxTool, but it calls the tool with the
+    # shared async client
+
+    # A class without a docstring gets __doc__ = None, which would hide the
+    # __doc__ property that gives the model the tool's description
+    __doc__ = LazyToolboxTool.__dict__["__doc__"]
+
+    async def __call__(self, *args, **kwargs):
+        name = self.__name__
+        timeout = tool_timeout(name)
+        # Problems reaching the Toolbox server go back to the model, so it can
+        # decide what to do, rather than failing the whole turn
+        try:
+            tool = await get_async_tool(self._loader.url, name)
+        except asyncio.TimeoutError:
+            return f"The {name} tool could not be loaded from the Toolbox server within {TOOLBOX_LOAD_TIMEOUT_SECONDS:g} seconds."
+        except Exception as e:
+            return f"The {name} tool could not be loaded from the Toolbox server: {e}"
+        try:
+            return await asyncio.wait_for(tool(*args, **kwargs), timeout=timeout)
+        except asyncio.TimeoutError:
+            return f"The {name} tool did not respond within {timeout:g} seconds."
+        except ClientError as e:
+            return f"The {name} tool could not reach the Toolbox server: {e}"
+
+
+class AsyncToolboxToolset(BaseToolset):
+    """Gives the agent a set of async stand-ins, and closes the shared Toolbox clients when the runner shuts down."""
+
+    def __init__(self, tools: list[AsyncLazyToolboxTool]):
+        super().__init__()
+        self.tools = tools
+
+    async def get_tools(self, readonly_context=None) -> list[FunctionTool]:
+        return [FunctionTool(tool) for tool in self.tools]
+
+    async def close(self):
+        await close_async_toolbox_clients()
+
+
+def load_async_toolbox_tools(url: str, names: list[str]) -> list[AsyncLazyToolboxTool]:
+    """Returns an async stand-in for each named Toolbox tool without waiting for the server."""
+    return load_toolbox_tools(url, names, AsyncLazyToolboxTool)
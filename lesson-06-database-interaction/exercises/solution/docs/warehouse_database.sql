@@ -47,4 +47,57 @@ CREATE TABLE IF NOT EXISTS audit_log (
     details TEXT,
     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (product_id) REFERENCES products(product_id)
-);
\ No newline at end of file
+);
+
+-- Updates the stock of a product and records it in the audit log in one
+-- transaction, so a change is never made without its audit entry (or the
+-- other way around). Returns the product with its previous and new stock.
+DROP PROCEDURE IF EXISTS update_stock_with_audit;
+
+DELIMITER //
+CREATE PROCEDURE update_stock_with_audit(
+    IN p_product_id INT,
+    IN p_new_stock_quantity INT,
+    IN p_details TEXT
+)
+BEGIN
+    DECLARE v_previous_stock_quantity INT DEFAULT NULL;
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        ROLLBACK;
+        RESIGNAL;
+    END;
+
+    START TRANSACTION;
+
+    -- Lock the row so the previous quantity we record is the one we replace
+    SELECT stock_quantity INTO v_previous_stock_quantity
+    FROM products
+    WHERE product_id = p_product_id
+    FOR UPDATE;
+
+    -- The handler above rolls back the transaction
+    IF v_previous_stock_quantity IS NULL THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'No product has this product_id';
+    END IF;
+
+    UPDATE products
+    SET stock_quantity = p_new_stock_quantity
+    WHERE product_id = p_product_id;
+
+    INSERT INTO audit_log (product_id, action, details)
+    VALUES (
+        p_product_id,
+        'update_product_stock',
+        CONCAT_WS('. ',
+            CONCAT('Stock changed from ', v_previous_stock_quantity, ' to ', p_new_stock_quantity),
+            NULLIF(p_details, ''))
+    );
+
+    COMMIT;
+
+    SELECT product_id, name, v_previous_stock_quantity AS previous_stock_quantity, stock_quantity AS new_stock_quantity
+    FROM products
+    WHERE product_id = p_product_id;
+END //
+DELIMITER ;
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from inspect import Parameter, Signature
+from toolbox_core import ToolboxSyncClient
+from toolbox_core.protocol import ParameterSchema
+
+# Loads Toolbox tools without making the agent wait for the Toolbox server.
+#
+# Calling load_tool() for every tool when the agent is imported means that
+# startup waits for a round trip to the server for each tool, and fails if
+# the server isn't up yet. Instead, the agent gets a stand-in for each tool
+# straight away, and the real tools are loaded from the server at the same
+# time in the background. A stand-in that is used before its tool has loaded
+# waits for it (or tries to load it again if the background load failed).
+#
+# The model needs each tool's description and parameters before it can call
+# it. Once every tool has loaded, we save these in a manifest on disk, named
+# after a hash of tools.yaml. While tools.yaml stays the same, later starts
+# read the manifest and never need the server until a tool is called.
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+TOOLBOX_TOOLS_FILE = os.environ.get("TOOLBOX_TOOLS_FILE", os.path.join(script_dir, "tools.yaml"))
+TOOLBOX_MANIFEST_CACHE_DIR = os.environ.get("TOOLBOX_MANIFEST_CACHE_DIR", os.path.join(script_dir, ".toolbox_cache"))
+# Set to false to only load each tool the first time it is used
+TOOLBOX_PREFETCH = os.environ.get("TOOLBOX_PREFETCH", "true").lower() in ("1", "true", "yes")
+# How long a tool call waits for its tool to load from the server
+TOOLBOX_LOAD_TIMEOUT_SECONDS = float(os.environ.get("TOOLBOX_LOAD_TIMEOUT_SECONDS", "30"))
+
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def tool_schema(tool) -> dict:
+    """Gets the parts of a loaded tool that the model needs, in a form we can save as JSON."""
+    return {
+        "doc": tool.__doc__,
+        "parameters": [param.model_dump(exclude_unset=True) for param in tool._params],
+    }
+
+
+def schema_signature(schema: dict) -> Signature:
+    """Rebuilds the signature of a tool from its saved schema, the same way toolbox_core does."""
+    params = [ParameterSchema.model_validate(param).to_param() for param in schema["parameters"]]
+    # Parameters without a default have to come first
+    params = [p for p in params if p.default is Parameter.empty] + [p for p in params if p.default is not Parameter.empty]
+    return Signature(parameters=params, return_annotation=str)
+
+
+class LazyToolboxTool:
+    # Stands in for a Toolbox tool. The name, docstring, and signature are what
+    # the agent uses to describe the tool to the model, so they come from the
+    # saved manifest if we have one, or from the real tool once it has loaded.
+
+    def __init__(self, loader: "ToolboxToolLoader", name: str):
+        self._loader = loader
+        self.__name__ = name
+        self.__qualname__ = f"{self.__class__.__qualname__}.{name}"
+        self._signature = None
+
+    @property
+    def __doc__(self) -> str:
+        return self._loader.schema(self.__name__)["doc"]
+
+    @property
+    def __signature__(self) -> Signature:
+        if self._signature is None:
+            self._signature = schema_signature(self._loader.schema(self.__name__))
+        return self._signature
+
+    @property
+    def __annotations__(self) -> dict:
+        return {param.name: param.annotation for param in self.__signature__.parameters.values()}
+
+    def __call__(self, *args, **kwargs):
+        return self._loader.get_tool(self.__name__)(*args, **kwargs)
+
+
+class ToolboxToolLoader:
+    """Loads a set of tools from a Toolbox server in the background, and hands out stand-ins for them."""
+
+    def __init__(
+        self,
+        url: str,
+        names: list[str],
+        tools_file: str = TOOLBOX_TOOLS_FILE,
+        cache_dir: str = TOOLBOX_MANIFEST_CACHE_DIR,
+    ):
+        self.started_at = time.perf_counter()
+        self.url = url
+        self.names = list(names)
+        self._lock = threading.Lock()
+        self._client = None
+        self._futures = {}
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.names)), thread_name_prefix="toolbox")
+        self.failed = {}
+        self.loaded_ms = None
+
+        # The saved manifest is only used if tools.yaml hasn't changed since it was saved
+        self.cache_path = None
+        self.schemas = {}
+        if os.path.exists(tools_file):
+            self.cache_path = os.path.join(cache_dir, f"{file_hash(tools_file)}.json")
+            try:
+                with open(self.cache_path) as f:
+                    self.schemas = json.load(f)
+            except (OSError, ValueError):
+                self.schemas = {}
+        self.manifest_cached = all(name in self.schemas for name in self.names)
+
+    def _get_client(self) -> ToolboxSyncClient:
+        # Creating the client doesn't contact the server
+        with self._lock:
+            if self._client is None:
+                self._client = ToolboxSyncClient(self.url)
+            return self._client
+
+    def _load_tool(self, name: str):
+        tool = self._get_client().load_tool(name)
+        with self._lock:
+            self.failed.pop(name, None)
+            self.schemas[name] = tool_schema(tool)
+            save = not self.manifest_cached and all(self.schemas.get(other) for other in self.names)
+            if save:
+                self.manifest_cached = True
+        if save:
+            self.save_manifest()
+        return tool
+
+    def _loaded(self, name: str, future):
+        error = future.exception()
+        with self._lock:
+            if error is not None:
+                self.failed[name] = str(error)
+            done = all(f.done() for f in self._futures.values()) and len(self._futures) == len(self.names)
+            first_time = done and self.loaded_ms is None
+            if first_time:
+                self.loaded_ms = (time.perf_counter() - self.started_at) * 1000
+        if error is not None:
+            print(f"Could not load Toolbox tool {name} from {self.url}, will try again when it is used: {error}")
+        if first_time:
+            print(f"Toolbox startup: {json.dumps(self.report())}")
+
+    def load(self, name: str):
+        """Starts loading a tool if it isn't loaded or loading already, and returns its Future."""
+        with self._lock:
+            future = self._futures.get(name)
+            if future is None or (future.done() and future.exception() is not None):
+                future = self._executor.submit(self._load_tool, name)
+                self._futures[name] = future
+            else:
+                return future
+        future.add_done_callback(lambda f: self._loaded(name, f))
+        return future
+
+    def start(self):
+        """Starts loading every tool at the same time, without waiting for them."""
+        for name in self.names:
+            self.load(name)
+
+    def get_tool(self, name: str):
+        """Gets the real tool, waiting for it to load if it hasn't yet."""
+        return self.load(name).result(timeout=TOOLBOX_LOAD_TIMEOUT_SECONDS)
+
+    def schema(self, name: str) -> dict:
+        """Gets the docstring and parameters of a tool, from the manifest or, failing that, the server."""
+        schema = self.schemas.get(name)
+        if schema is None:
+            self.get_tool(name)
+            schema = self.schemas[name]
+        return schema
+
+    def save_manifest(self):
+        if self.cache_path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(self.cache_path + ".tmp", "w") as f:
+                json.dump({name: self.schemas[name] for name in self.names}, f, indent=2)
+            os.replace(self.cache_path + ".tmp", self.cache_path)
+        except OSError as e:
+            print(f"Could not save the Toolbox manifest to {self.cache_path}: {e}")
+
+    def tools(self, tool_class=LazyToolboxTool) -> list[LazyToolboxTool]:
+        return [tool_class(self, name) for name in self.names]
+
+    def report(self) -> dict:
+        """Returns how startup went: where the schemas came from, how long loading took, and what failed."""
+        return {
+            "url": self.url,
+            "tools": len(self.names),
+            "manifest": self.cache_path,
+            "manifest_cached": self.manifest_cached,
+            "loaded_ms": round(self.loaded_ms, 1) if self.loaded_ms is not None else None,
+            "failed": dict(self.failed),
+        }
+
+
+def load_toolbox_tools(url: str, names: list[str], tool_class=LazyToolboxTool) -> list[LazyToolboxTool]:
+    """
+    Returns a stand-in for each named Toolbox tool without waiting for the server.
+    Unless TOOLBOX_PREFETCH is false, the tools start loading in the background straight away.
+    """
+    loader = ToolboxToolLoader(url, names)
+    tools = loader.tools(tool_class)
+    if TOOLBOX_PREFETCH:
+        loader.start()
+    source = f"the saved manifest {loader.cache_path}" if loader.manifest_cached else "the server, when first needed"
+    print(f"Set up {len(tools)} Toolbox tools in {(time.perf_counter() - loader.started_at) * 1000:.1f} ms, with schemas from {source}")
+    return tools
@@ -0,0 +1,197 @@
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import time
+
+# Measures how well, and how quickly, each search backend finds the chunks
+# that answer a fixed set of questions.
+#
+# queries.json has questions about the lesson 08 financial filings and
+# Betty's Bird Boutique documents from the project. Each question lists
+# phrases from the documents that answer it, with a grade: 2 for a phrase
+# that answers the question, 1 for one that is related. A result chunk is as
+# relevant as the best graded phrase it contains, so the same labels work
+# for every backend, however it splits the documents into chunks.
+#
+# The local index is always benchmarked, built from each corpus's docs
+# directory. Vertex AI Search is also benchmarked for a corpus when
+# DATASTORE_PROJECT_ID and the engine ID variable named in queries.json are
+# set. Results come straight from each backend, without the search cache.
+#
+# Examples:
+#   python run_benchmark.py
+#   python run_benchmark.py --corpus bettys --k 3
+#   python run_benchmark.py --repeat 20 --json results.json
+
+benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+lesson_dir = os.path.dirname(benchmark_dir)
+
+BACKENDS = ["local", "vertex"]
+
+
+def load_modules():
+    """Imports the search and packing code from the demo."""
+    # The benchmark picks a backend for each search itself
+    os.environ["DATASTORE_BACKEND"] = "vertex"
+    sys.path.insert(0, lesson_dir)
+    from demo import context_packing, datastore, local_index
+    return {"context_packing": context_packing, "datastore": datastore, "local_index": local_index}
+
+
+def normalize(text: str) -> str:
+    """Lowercases text and evens out whitespace and quotes, so phrases match however the PDF was extracted."""
+    text = text.casefold().replace("’", "'").replace("“", '"').replace("”", '"')
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def chunk_grade(content: str, labels: list[dict]) -> int:
+    """Returns the grade of the best labelled phrase in a chunk, or 0 if it has none."""
+    content = normalize(content)
+    return max((label["grade"] for label in labels if normalize(label["text"]) in content), default=0)
+
+
+def score_query(chunks: list[dict], labels: list[dict], k: int) -> dict:
+    """Computes recall@k, the reciprocal rank, and nDCG@k for one query's results."""
+    top = chunks[:k]
+    found = [label for label in labels if any(normalize(label["text"]) in normalize(chunk["content"]) for chunk in top)]
+    grades = [chunk_grade(chunk["content"], labels) for chunk in chunks]
+    first = next((rank for rank, grade in enumerate(grades, start=1) if grade > 0), None)
+
+    def dcg(values):
+        return sum((2 ** grade - 1) / math.log2(rank + 1) for rank, grade in enumerate(values, start=1))
+    ideal = dcg(sorted((label["grade"] for label in labels), reverse=True)[:k])
+    return {
+        "recall": len(found) / len(labels),
+        "reciprocal_rank": 1 / first if first else 0.0,
+        # A chunk with several phrases can beat the ideal ordering of the phrases
+        "ndcg": min(1.0, dcg(grades[:k]) / ideal) if ideal else 0.0,
+    }
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Returns the nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def check_labels(chunks: list[dict], queries: list[dict]):
+    """Warns about labelled phrases that aren't in any chunk, which no backend could find."""
+    contents = [normalize(chunk["content"]) for chunk in chunks]
+    for query in queries:
+        for label in query["relevant"]:
+            if not any(normalize(label["text"]) in content for content in contents):
+                print(f"Warning: {label['text']!r} (for {query['query']!r}) is not in any chunk")
+
+
+def make_backends(modules: dict, corpus_name: str, corpus: dict, queries: list[dict]) -> dict:
+    """Returns a search(query, limit) function for each backend that is available for a corpus."""
+    backends = {}
+    local_index = modules["local_index"]
+    docs_dir = os.path.normpath(os.path.join(benchmark_dir, corpus["docs_dir"]))
+    index_dir = os.path.join(benchmark_dir, ".local_index", corpus_name)
+    report = local_index.update_index(docs_dir, index_dir)
+    if report["changed"]:
+        print(f"Updated the local index for {corpus_name}: {report}")
+    index = local_index.LocalIndex(index_dir)
+    check_labels(index.chunks, queries)
+    backends["local"] = index.search
+
+    project_id = os.environ.get("DATASTORE_PROJECT_ID")
+    engine_id = os.environ.get(corpus["engine_id_env"])
+    if project_id and engine_id:
+        datastore = modules["datastore"]
+        location = os.environ.get("DATASTORE_LOCATION", "global")
+
+        def vertex_search(query, limit):
+            return list(datastore.iter_search_chunks(project_id, location, engine_id, query, max_results=limit, min_relevance=None))
+        backends["vertex"] = vertex_search
+    else:
+        print(f"Skipping Vertex AI Search for {corpus_name}: set DATASTORE_PROJECT_ID and {corpus['engine_id_env']}")
+    return backends
+
+
+def run_backend(modules: dict, search, queries: list[dict], k: int, limit: int, repeat: int) -> dict:
+    """Runs every query against one backend, and returns the averaged scores, latency, and prompt sizes."""
+    context_packing = modules["context_packing"]
+    packer = context_packing.ContextPacker()
+    # Search once to load anything the backend loads lazily
+    search(queries[0]["query"], limit)
+
+    scores = []
+    latencies = []
+    raw_tokens = []
+    packed_tokens = []
+    for query in queries:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            chunks = search(query["query"], limit)
+            latencies.append(time.perf_counter() - start)
+        scores.append(score_query(chunks, query["relevant"], k))
+        contents = [chunk["content"] for chunk in chunks]
+        raw_tokens.append(sum(context_packing.estimate_tokens(content) for content in contents))
+        packed = packer.pack(contents)
+        packed_tokens.append(sum(context_packing.estimate_tokens(content) for content in packed))
+
+    latencies.sort()
+    return {
+        "queries": len(queries),
+        f"recall@{k}": sum(score["recall"] for score in scores) / len(scores),
+        "mrr": sum(score["reciprocal_rank"] for score in scores) / len(scores),
+        f"ndcg@{k}": sum(score["ndcg"] for score in scores) / len(scores),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "prompt_tokens": sum(raw_tokens) / len(raw_tokens),
+        "packed_prompt_tokens": sum(packed_tokens) / len(packed_tokens),
+        "per_query": [
+            {"query": query["query"], **score}
+            for query, score in zip(queries, scores)
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality and latency of the lesson 08 search backends.")
+    parser.add_argument("--queries", default=os.path.join(benchmark_dir, "queries.json"))
+    parser.add_argument("--corpus", help="Only run the queries for this corpus")
+    parser.add_argument("--backend", choices=BACKENDS, help="Only benchmark this backend")
+    parser.add_argument("--k", type=int, default=5, help="How many results count for recall@k and nDCG@k")
+    parser.add_argument("--limit", type=int, default=10, help="How many results to ask each backend for")
+    parser.add_argument("--repeat", type=int, default=5, help="How many times to run each query when timing it")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    with open(args.queries) as f:
+        benchmark = json.load(f)
+    modules = load_modules()
+
+    results = []
+    print(f"{'corpus':<12}{'backend':<9}{'queries':>8}{'recall@k':>10}{'mrr':>7}{'ndcg@k':>8}{'p50 ms':>9}{'p99 ms':>9}{'tokens':>8}{'packed':>8}")
+    for corpus_name, corpus in benchmark["corpora"].items():
+        if args.corpus and corpus_name != args.corpus:
+            continue
+        queries = [query for query in benchmark["queries"] if query["corpus"] == corpus_name]
+        if not queries:
+            continue
+        for backend, search in make_backends(modules, corpus_name, corpus, queries).items():
+            if args.backend and backend != args.backend:
+                continue
+            result = {"corpus": corpus_name, "backend": backend, **run_backend(modules, search, queries, args.k, args.limit, args.repeat)}
+            results.append(result)
+            print(
+                f"{corpus_name:<12}{backend:<9}{result['queries']:>8}{result[f'recall@{args.k}']:>10.3f}{result['mrr']:>7.3f}"
+                f"{result[f'ndcg@{args.k}']:>8.3f}{result['p50_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+                f"{result['prompt_tokens']:>8.0f}{result['packed_prompt_tokens']:>8.0f}"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
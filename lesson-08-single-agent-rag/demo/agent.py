@@ -1,6 +1,12 @@
 import os
 from google.adk.agents import Agent
-from .datastore import datastore_search_tool
+from .datastore import cancel_search_prefetch, start_search_prefetch, warm_search_client
+
+# Set USE_ASYNC_TOOLS to register the async (non-blocking) versions of the tools
+if os.environ.get("USE_ASYNC_TOOLS", "").lower() in ("1", "true", "yes"):
+    from .async_datastore import datastore_multi_search_tool, datastore_search_tool
+else:
+    from .datastore import datastore_multi_search_tool, datastore_search_tool
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 instruction_file_path = os.path.join(script_dir, "agent-prompt.txt")
@@ -9,7 +15,10 @@ with open(instruction_file_path, "r") as f:
 
 model = "gemini-2.5-flash"
 
-tools = [datastore_search_tool]
+# Set up the search client now, rather than during the first question
+warm_search_client()
+
+tools = [datastore_search_tool, datastore_multi_search_tool]
 
 root_agent = Agent(
     name="financials_rag_agent",
@@ -17,4 +26,7 @@ root_agent = Agent(
     instruction=instruction,
     model=model,
     tools=tools,
+    # Start searching for the user's message while the model decides what to do
+    before_agent_callback=start_search_prefetch,
+    after_agent_callback=cancel_search_prefetch,
 )
@@ -0,0 +1,181 @@
+import asyncio
+import os
+import threading
+import weakref
+from google.adk.tools import ToolContext
+from google.api_core.client_options import ClientOptions
+from google.cloud import discoveryengine_v1 as discoveryengine
+from .context_packing import pack_context
+from .datastore import (
+    DATASTORE_BACKEND,
+    SEARCH_MAX_RESULTS,
+    SEARCH_MIN_RELEVANCE,
+    SEARCH_PAGE_SIZE,
+    get_api_endpoint,
+    keep_chunk,
+    reciprocal_rank_fusion,
+    search_request,
+    search_spec,
+    to_chunk,
+)
+from .prefetch import prefetched_results_async
+from .search_cache import search_cache
+
+if DATASTORE_BACKEND == "local":
+    from . import local_index
+
+# Async versions of the search tools in datastore.py.
+#
+# The tools in datastore.py block the event loop that the ADK runner uses for
+# every session in this process while they wait for Vertex AI Search. These
+# versions have the same names, parameters, and return values, but use the
+# async Discovery Engine client, so other sessions keep running while a
+# search is in progress.
+#
+# agent.py registers these instead of the ones in datastore.py when
+# USE_ASYNC_TOOLS is set.
+
+# Async clients are tied to the event loop they were created in, so we keep
+# one client per API endpoint for each running loop
+_async_search_clients = weakref.WeakKeyDictionary()
+_async_search_clients_lock = threading.Lock()
+
+def get_async_search_client(location: str) -> discoveryengine.SearchServiceAsyncClient:
+    """Gets the shared SearchServiceAsyncClient for a location in the running event loop."""
+    loop = asyncio.get_running_loop()
+    api_endpoint = get_api_endpoint(location)
+    with _async_search_clients_lock:
+        clients = _async_search_clients.setdefault(loop, {})
+        client = clients.get(api_endpoint)
+        if client is None:
+            client = discoveryengine.SearchServiceAsyncClient(
+                client_options=ClientOptions(api_endpoint=api_endpoint)
+            )
+            clients[api_endpoint] = client
+    return client
+
+async def aiter_search_chunks(
+    project_id: str,
+    location: str,
+    engine_id: str,
+    search_query: str,
+    page_size: int = SEARCH_PAGE_SIZE,
+    max_results: int = SEARCH_MAX_RESULTS,
+    min_relevance: float = SEARCH_MIN_RELEVANCE,
+):
+    """
+    Yields the matching chunks, best match first, fetching pages of results only as they are needed.
+    Stops after max_results chunks, or at the first chunk scoring below min_relevance.
+    """
+    if DATASTORE_BACKEND == "local":
+        # The first search may have to wait for the index to load, so do it in a worker thread
+        for chunk in await asyncio.to_thread(local_index.search_chunks, search_query, max_results):
+            if not keep_chunk(chunk, min_relevance):
+                return
+            yield chunk
+        return
+
+    client = get_async_search_client(location)
+    pager = await client.search(search_request(project_id, location, engine_id, search_query, min(page_size, max_results)))
+
+    # The pager only fetches the next page when we iterate past the current one
+    count = 0
+    async for result in pager:
+        chunk = to_chunk(result)
+        if chunk is None:
+            continue
+        if not keep_chunk(chunk, min_relevance):
+            return
+        yield chunk
+        count += 1
+        if count >= max_results:
+            return
+
+async def search_chunks(
+    project_id: str,
+    location: str,
+    engine_id: str,
+    search_query: str,
+) -> list[dict]:
+    """Searches the datastore and returns the ID and content of each matching chunk, best match first."""
+    if DATASTORE_BACKEND == "local":
+        # Local searches are quick, so they aren't cached
+        return [chunk async for chunk in aiter_search_chunks(project_id, location, engine_id, search_query)]
+
+    # Repeated (or trivially different) queries are answered from the cache
+    cache_spec = {**search_spec, "max_results": SEARCH_MAX_RESULTS, "min_relevance": SEARCH_MIN_RELEVANCE}
+    found, chunks = search_cache.get(engine_id, location, search_query, cache_spec)
+    if found:
+        return chunks
+
+    chunks = [chunk async for chunk in aiter_search_chunks(project_id, location, engine_id, search_query)]
+
+    search_cache.put(engine_id, location, search_query, cache_spec, chunks)
+    return chunks
+
+async def search(
+    project_id: str,
+    location: str,
+    engine_id: str,
+    search_query: str,
+) -> list[str]:
+    chunks = await search_chunks(project_id, location, engine_id, search_query)
+    return [chunk["content"] for chunk in chunks]
+
+async def multi_search(
+    project_id: str,
+    location: str,
+    engine_id: str,
+    search_queries: list[str],
+) -> list[str]:
+    """Runs several searches at the same time and merges their results with reciprocal rank fusion."""
+    rankings = await asyncio.gather(*[
+        search_chunks(project_id, location, engine_id, search_query)
+        for search_query in dict.fromkeys(search_queries)
+    ])
+    return [chunk["content"] for chunk in reciprocal_rank_fusion(rankings)]
+
+async def datastore_search_tool( search_query: str, tool_context: ToolContext ):
+    """
+    Searches financial documents (10-K and 10-Q reports) for the requested information.
+
+    Args:
+        search_query (str): What information about the company finances the customer is looking for
+    """
+    try:
+        # Use the search started for the user's message, if it was similar enough
+        results = await prefetched_results_async(tool_context, search_query)
+        if results is None:
+            results = await search(
+                project_id=os.environ.get("DATASTORE_PROJECT_ID"),
+                engine_id=os.environ.get("DATASTORE_ENGINE_ID"),
+                location=os.environ.get("DATASTORE_LOCATION", "global"),
+                search_query=search_query,
+            )
+        if not results:
+            return "No results found."
+        # Remove near-duplicates and keep within the token budget
+        return pack_context(results)
+    except Exception as e:
+        return f"A problem occurred: {e}"
+
+async def datastore_multi_search_tool( search_queries: list[str] ):
+    """
+    Searches financial documents (10-K and 10-Q reports) using several wordings of the same request at once.
+
+    Args:
+        search_queries (list[str]): Different ways of phrasing what information about the company finances the customer is looking for
+    """
+    try:
+        results = await multi_search(
+            project_id=os.environ.get("DATASTORE_PROJECT_ID"),
+            engine_id=os.environ.get("DATASTORE_ENGINE_ID"),
+            location=os.environ.get("DATASTORE_LOCATION", "global"),
+            search_queries=search_queries,
+        )
+        if not results:
+            return "No results found."
+        # Remove near-duplicates and keep within the token budget
+        return pack_context(results)
+    except Exception as e:
+        return f"A problem occurred: {e}"
@@ -0,0 +1,166 @@
+import os
+import re
+import threading
+
+# Packs search results into a smaller, more useful context for the model.
+#
+# 10-K and 10-Q filings repeat a lot of text between quarters, so a search
+# often returns several chunks that say nearly the same thing. Every chunk
+# we return becomes part of the prompt, which makes the next model call
+# slower and more expensive. After each search we:
+# 1. Drop chunks that are near-duplicates of a better ranked chunk, comparing
+#    the sets of overlapping word sequences ("shingles") in each chunk
+# 2. Pick the rest in an order that balances relevance against repeating
+#    what was already picked (maximal marginal relevance, or MMR)
+# 3. Stop once the chunks fill the token budget
+#
+# Token counts are estimated from the number of characters, which is close
+# enough for a budget and doesn't need a tokenizer.
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "2000"))
+# Chunks whose shingles overlap at least this much are near-duplicates
+CONTEXT_DUPLICATE_THRESHOLD = float(os.environ.get("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+# 1.0 picks purely by relevance, lower values prefer chunks unlike those already picked
+CONTEXT_MMR_LAMBDA = float(os.environ.get("CONTEXT_MMR_LAMBDA", "0.7"))
+SHINGLE_WORDS = 5
+CHARACTERS_PER_TOKEN = 4
+
+_word = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimates how many tokens the model will see for some text."""
+    return (len(text) + CHARACTERS_PER_TOKEN - 1) // CHARACTERS_PER_TOKEN
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> set:
+    """Gets the set of overlapping runs of words in some text."""
+    words = _word.findall(text.casefold())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[start:start + size]) for start in range(len(words) - size + 1)}
+
+
+def jaccard(first: set, second: set) -> float:
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """Cuts text down to about this many tokens, at a word boundary, or returns "" if none of it fits."""
+    if estimate_tokens(text) <= tokens:
+        return text
+    # Leave room for the " ..." that marks the cut
+    limit = tokens * CHARACTERS_PER_TOKEN - 4
+    if limit <= 0:
+        return ""
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > 0 else limit] + " ..."
+
+
+class ContextPacker:
+    """Removes near-duplicates from ranked results and fits them to a token budget."""
+
+    def __init__(
+        self,
+        token_budget: int = CONTEXT_TOKEN_BUDGET,
+        duplicate_threshold: float = CONTEXT_DUPLICATE_THRESHOLD,
+        mmr_lambda: float = CONTEXT_MMR_LAMBDA,
+    ):
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+        self.mmr_lambda = mmr_lambda
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.results_in = 0
+        self.results_out = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.duplicates_removed = 0
+        # The same counts for the most recent call on its own
+        self.last_call = {}
+
+    def pack(self, results: list[str]) -> list[str]:
+        """Returns the packed results, best first. results must be ordered best first."""
+        results = [result for result in results if result]
+        result_shingles = [shingles(result) for result in results]
+
+        # Keep the best ranked copy of each group of near-duplicates
+        kept = []
+        for index in range(len(results)):
+            if all(jaccard(result_shingles[index], result_shingles[other]) < self.duplicate_threshold for other in kept):
+                kept.append(index)
+
+        # The tools pass us only the text of each result (search() drops any
+        # relevance_score), so relevance falls off with rank
+        relevance = {index: 1.0 - rank / len(results) for rank, index in enumerate(kept)}
+        packed = []
+        remaining = list(kept)
+        budget = self.token_budget
+        while remaining and budget > 0:
+            def mmr(index):
+                redundancy = max((jaccard(result_shingles[index], result_shingles[other]) for other in packed), default=0.0)
+                return self.mmr_lambda * relevance[index] - (1 - self.mmr_lambda) * redundancy
+            best = max(remaining, key=mmr)
+            remaining.remove(best)
+            packed.append(best)
+            budget -= estimate_tokens(results[best])
+
+        packed_results = [results[index] for index in packed]
+        if budget < 0 and packed_results:
+            # Trim the last chunk so the total fits the budget, or drop it if
+            # there isn't room for any of its content
+            last_tokens = estimate_tokens(packed_results[-1]) + budget
+            last = truncate_to_tokens(packed_results[-1], last_tokens) if last_tokens > 0 else ""
+            if last:
+                packed_results[-1] = last
+            else:
+                packed_results.pop()
+
+        tokens_in = sum(estimate_tokens(result) for result in results)
+        tokens_out = sum(estimate_tokens(result) for result in packed_results)
+        last_call = {
+            "results_in": len(results),
+            "results_out": len(packed_results),
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+            "tokens_saved": tokens_in - tokens_out,
+            "duplicates_removed": len(results) - len(kept),
+        }
+        with self._lock:
+            self.last_call = last_call
+            self.calls += 1
+            self.results_in += len(results)
+            self.results_out += len(packed_results)
+            self.tokens_in += tokens_in
+            self.tokens_out += tokens_out
+            self.duplicates_removed += len(results) - len(kept)
+        return packed_results
+
+    def stats(self) -> dict:
+        """Returns how many results and tokens packing has saved in total, and in the most recent call."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "results_in": self.results_in,
+                "results_out": self.results_out,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "tokens_saved": self.tokens_in - self.tokens_out,
+                "duplicates_removed": self.duplicates_removed,
+                "last_call": dict(self.last_call),
+            }
+
+
+context_packer = ContextPacker()
+
+
+def pack_context(results: list[str]) -> list[str]:
+    """Removes near-duplicate results and fits the rest to the token budget."""
+    return context_packer.pack(results)
+
+
+def context_packing_stats() -> dict:
+    """Gets the tokens saved by packing search results, in total and by the most recent call."""
+    return context_packer.stats()
@@ -1,6 +1,13 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.tools import ToolContext
 from google.api_core.client_options import ClientOptions
 from google.cloud import discoveryengine_v1 as discoveryengine
+from .context_packing import pack_context
+from .prefetch import prefetch_executor, prefetched_results, prefetcher, user_message_text, worth_prefetching
+from .search_cache import search_cache
 
 # Definition of a tool that accesses a Vertex AI Search Datastore
 
@@ -14,55 +21,240 @@ from google.cloud import discoveryengine_v1 as discoveryengine
 # You can see the definitions at
 # https://cloud.google.com/python/docs/reference/discoveryengine/latest/google.cloud.discoveryengine_v1.types
 #
-def search(
-    project_id: str,
-    location: str,
-    engine_id: str,
-    search_query: str,
-) -> list[str]:
+
+# "vertex" searches the Vertex AI Search engine in DATASTORE_ENGINE_ID, while
+# "local" searches an index of the PDFs in docs/ (see local_index.py)
+DATASTORE_BACKEND = os.environ.get("DATASTORE_BACKEND", "vertex")
+if DATASTORE_BACKEND == "local":
+    # Only the local backend needs NumPy and pypdf
+    from . import local_index
+
+# Creating a SearchServiceClient sets up a new gRPC channel, so instead of
+# creating one for every search we keep one client per API endpoint and share
+# it between all searches. The clients are safe to use from several threads.
+_search_clients = {}
+_search_clients_lock = threading.Lock()
+
+def get_api_endpoint(location: str) -> str:
+    """Gets the Vertex AI Search API endpoint for a location."""
     #  For more information, refer to:
     # https://cloud.google.com/generative-ai-app-builder/docs/locations#specify_a_multi-region_for_your_data_store
-    client_options = (
-        ClientOptions(api_endpoint=f"{location}-discoveryengine.googleapis.com")
-        if location != "global"
-        else None
-    )
+    if location == "global":
+        return discoveryengine.SearchServiceClient.DEFAULT_ENDPOINT
+    return f"{location}-discoveryengine.googleapis.com"
 
-    # Create a client
-    client = discoveryengine.SearchServiceClient(client_options=client_options)
+def get_search_client(location: str) -> discoveryengine.SearchServiceClient:
+    """Gets the shared SearchServiceClient for a location, creating it the first time."""
+    api_endpoint = get_api_endpoint(location)
+    client = _search_clients.get(api_endpoint)
+    if client is None:
+        with _search_clients_lock:
+            client = _search_clients.get(api_endpoint)
+            if client is None:
+                client = discoveryengine.SearchServiceClient(
+                    client_options=ClientOptions(api_endpoint=api_endpoint)
+                )
+                _search_clients[api_endpoint] = client
+    return client
 
-    # The full resource name of the search app serving config
-    serving_config = f"projects/{project_id}/locations/{location}/collections/default_collection/engines/{engine_id}/servingConfigs/default_config"
+def warm_local_index():
+    try:
+        local_index.get_local_index()
+    except Exception as e:
+        # The search will try again, and report the problem, when it is used
+        print(f"Could not load the local search index: {e}")
 
+def warm_search_client(location: str = None):
+    """Creates the client for a location ahead of the first search, so the first question isn't slower."""
+    if DATASTORE_BACKEND == "local":
+        # Building the index can take a while, so load (or build) it in the
+        # background. A search that comes before it is ready waits for it.
+        threading.Thread(target=warm_local_index, name="local-index", daemon=True).start()
+        return
+    location = location or os.environ.get("DATASTORE_LOCATION", "global")
+    try:
+        get_search_client(location)
+    except Exception as e:
+        # The search will try again, and report the problem, when it is used
+        print(f"Could not create the search client for {location}: {e}")
+
+# How many chunks to ask for in each page of results, the most chunks a
+# search returns, and (if set) the lowest relevance score a chunk may have.
+# Results arrive best first, and pages are only fetched as they are needed,
+# so a search stops asking for pages as soon as it has enough chunks or the
+# scores drop below the threshold.
+SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", "10"))
+SEARCH_MAX_RESULTS = int(os.environ.get("SEARCH_MAX_RESULTS", "10"))
+SEARCH_MIN_RELEVANCE = float(os.environ["SEARCH_MIN_RELEVANCE"]) if os.environ.get("SEARCH_MIN_RELEVANCE") else None
+
+# The settings for every search request. These are part of the search cache
+# key, so changing them doesn't return results found with the old settings.
+search_spec = {
+    "page_size": SEARCH_PAGE_SIZE,
     # discoveryengine.SearchRequest.ContentSearchSpec
-    content_search_spec = {
+    "content_search_spec": {
         "search_result_mode": discoveryengine.SearchRequest.ContentSearchSpec.SearchResultMode.CHUNKS
-    }
+    },
+    "query_expansion_spec": {
+        "condition": discoveryengine.SearchRequest.QueryExpansionSpec.Condition.AUTO,
+    },
+    "spell_correction_spec": {
+        "mode": discoveryengine.SearchRequest.SpellCorrectionSpec.Mode.AUTO,
+    },
+}
 
-    # discoveryengine.SearchRequest
-    request = {
+def search_request(project_id: str, location: str, engine_id: str, search_query: str, page_size: int) -> dict:
+    """Builds a discoveryengine.SearchRequest as a dict."""
+    # The full resource name of the search app serving config
+    serving_config = f"projects/{project_id}/locations/{location}/collections/default_collection/engines/{engine_id}/servingConfigs/default_config"
+
+    return {
         "serving_config": serving_config,
         "query": search_query,
-        "page_size": 10,
-        "content_search_spec": content_search_spec,
-        "query_expansion_spec": {
-            "condition": discoveryengine.SearchRequest.QueryExpansionSpec.Condition.AUTO,
-        },
-        "spell_correction_spec": {
-            "mode": discoveryengine.SearchRequest.SpellCorrectionSpec.Mode.AUTO,
-        },
+        **search_spec,
+        "page_size": page_size,
     }
 
-    page_result = client.search(request)
+def to_chunk(result) -> dict:
+    """Gets the ID, content, and relevance score of a search result, or None if it has no content."""
+    if not (result.chunk and result.chunk.content):
+        return None
+    return {
+        # The resource name includes the document, so it is unique across documents
+        "id": result.chunk.name or result.chunk.id,
+        "content": result.chunk.content,
+        "relevance_score": result.chunk.relevance_score,
+    }
 
-    results = []
-    for result in page_result:
-        if result.chunk and result.chunk.content:
-            results.append(result.chunk.content)
+def keep_chunk(chunk: dict, min_relevance: float) -> bool:
+    """Returns False once chunks are no longer relevant enough, which means the search can stop."""
+    return min_relevance is None or chunk["relevance_score"] >= min_relevance
 
-    return results
+def iter_search_chunks(
+    project_id: str,
+    location: str,
+    engine_id: str,
+    search_query: str,
+    page_size: int = SEARCH_PAGE_SIZE,
+    max_results: int = SEARCH_MAX_RESULTS,
+    min_relevance: float = SEARCH_MIN_RELEVANCE,
+):
+    """
+    Yields the matching chunks, best match first, fetching pages of results only as they are needed.
+    Stops after max_results chunks, or at the first chunk scoring below min_relevance.
+    """
+    if DATASTORE_BACKEND == "local":
+        # Local chunks are scored too, so the same cutoff applies
+        for chunk in local_index.search_chunks(search_query, max_results):
+            if not keep_chunk(chunk, min_relevance):
+                return
+            yield chunk
+        return
+
+    # Get the shared client for this location
+    client = get_search_client(location)
+    pager = client.search(search_request(project_id, location, engine_id, search_query, min(page_size, max_results)))
+
+    # The pager only fetches the next page when we iterate past the current one
+    count = 0
+    for result in pager:
+        chunk = to_chunk(result)
+        if chunk is None:
+            continue
+        if not keep_chunk(chunk, min_relevance):
+            return
+        yield chunk
+        count += 1
+        if count >= max_results:
+            return
+
+def search_chunks(
+    project_id: str,
+    location: str,
+    engine_id: str,
+    search_query: str,
+) -> list[dict]:
+    """Searches the datastore and returns the ID and content of each matching chunk, best match first."""
+    if DATASTORE_BACKEND == "local":
+        # Local searches are quick, so they aren't cached
+        return list(iter_search_chunks(project_id, location, engine_id, search_query))
 
-def datastore_search_tool( search_query: str ):
+    # Repeated (or trivially different) queries are answered from the cache
+    cache_spec = {**search_spec, "max_results": SEARCH_MAX_RESULTS, "min_relevance": SEARCH_MIN_RELEVANCE}
+    found, chunks = search_cache.get(engine_id, location, search_query, cache_spec)
+    if found:
+        return chunks
+
+    chunks = list(iter_search_chunks(project_id, location, engine_id, search_query))
+
+    search_cache.put(engine_id, location, search_query, cache_spec, chunks)
+    return chunks
+
+def search(
+    project_id: str,
+    location: str,
+    engine_id: str,
+    search_query: str,
+) -> list[str]:
+    chunks = search_chunks(project_id, location, engine_id, search_query)
+    return [chunk["content"] for chunk in chunks]
+
+# Used to run several searches at the same time
+SEARCH_MAX_CONCURRENCY = int(os.environ.get("SEARCH_MAX_CONCURRENCY", "4"))
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_MAX_CONCURRENCY)
+
+# The usual constant for reciprocal rank fusion. Larger values give less
+# weight to the very top results of each search.
+RRF_K = 60
+
+def reciprocal_rank_fusion(rankings: list[list[dict]], k: int = RRF_K) -> list[dict]:
+    """
+    Merges several ranked lists of chunks into one, best first.
+    Each chunk scores 1 / (k + rank) for every list it appears in, and
+    chunks with the same ID are only returned once.
+    """
+    scores = {}
+    chunks = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, start=1):
+            scores[chunk["id"]] = scores.get(chunk["id"], 0.0) + 1.0 / (k + rank)
+            chunks.setdefault(chunk["id"], chunk)
+    return [chunks[chunk_id] for chunk_id in sorted(scores, key=scores.get, reverse=True)]
+
+def multi_search(
+    project_id: str,
+    location: str,
+    engine_id: str,
+    search_queries: list[str],
+) -> list[str]:
+    """Runs several searches at the same time and merges their results with reciprocal rank fusion."""
+    futures = [
+        search_executor.submit(search_chunks, project_id, location, engine_id, search_query)
+        for search_query in dict.fromkeys(search_queries)
+    ]
+    rankings = [future.result() for future in futures]
+    return [chunk["content"] for chunk in reciprocal_rank_fusion(rankings)]
+
+async def start_search_prefetch(callback_context: CallbackContext):
+    """Before-agent callback that starts searching for the user's message while the model decides what to do."""
+    query = user_message_text(callback_context)
+    if worth_prefetching(query):
+        future = prefetch_executor.submit(
+            search_chunks,
+            os.environ.get("DATASTORE_PROJECT_ID"),
+            os.environ.get("DATASTORE_LOCATION", "global"),
+            os.environ.get("DATASTORE_ENGINE_ID"),
+            query,
+        )
+        prefetcher.start(callback_context.invocation_id, query, future)
+    return None
+
+async def cancel_search_prefetch(callback_context: CallbackContext):
+    """After-agent callback that cancels the prefetched search if it wasn't used."""
+    prefetcher.cancel(callback_context.invocation_id)
+    return None
+
+def datastore_search_tool( search_query: str, tool_context: ToolContext ):
     """
     Searches financial documents (10-K and 10-Q reports) for the requested information.
 
@@ -70,14 +262,40 @@ def datastore_search_tool( search_query: str ):
         search_query (str): What information about the company finances the customer is looking for
     """
     try:
-        results = search(
+        # Use the search started for the user's message, if it was similar enough
+        results = prefetched_results(tool_context, search_query)
+        if results is None:
+            results = search(
+                project_id=os.environ.get("DATASTORE_PROJECT_ID"),
+                engine_id=os.environ.get("DATASTORE_ENGINE_ID"),
+                location=os.environ.get("DATASTORE_LOCATION", "global"),
+                search_query=search_query,
+            )
+        if not results:
+            return "No results found."
+        # Remove near-duplicates and keep within the token budget
+        return pack_context(results)
+    except Exception as e:
+        return f"A problem occurred: {e}"
+
+
+def datastore_multi_search_tool( search_queries: list[str] ):
+    """
+    Searches financial documents (10-K and 10-Q reports) using several wordings of the same request at once.
+
+    Args:
+        search_queries (list[str]): Different ways of phrasing what information about the company finances the customer is looking for
+    """
+    try:
+        results = multi_search(
             project_id=os.environ.get("DATASTORE_PROJECT_ID"),
             engine_id=os.environ.get("DATASTORE_ENGINE_ID"),
             location=os.environ.get("DATASTORE_LOCATION", "global"),
-            search_query=search_query,
+            search_queries=search_queries,
         )
         if not results:
             return "No results found."
-        return results
+        # Remove near-duplicates and keep within the token budget
+        return pack_context(results)
     except Exception as e:
         return f"A problem occurred: {e}"
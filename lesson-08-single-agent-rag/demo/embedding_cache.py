@@ -0,0 +1,154 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+# A persistent cache of embedding vectors.
+#
+# Building an index embeds every chunk, and the same chunks (and often the
+# same queries) are embedded again on every rebuild, in every copy of the
+# index, and by any reranking stage. We keep each vector in a SQLite
+# database, keyed by the name of the model that made it plus a hash of the
+# text, so it is only ever computed once for each model. Texts that aren't
+# in the cache are embedded together in batches, which is much cheaper than
+# one call per text for a real embedding model.
+#
+# The database is limited in size. Every lookup marks the vectors it found
+# as used, and the least recently used vectors are dropped first.
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", os.path.join(script_dir, "embedding_cache.sqlite"))
+# Set to 0 to turn the cache off
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+# How many texts to embed in one call on a cache miss
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "256"))
+
+# SQLite limits how many values one statement can have
+SQL_BATCH_SIZE = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """A SQLite cache of embedding vectors, keyed by model name and content hash."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        self.embedded = 0
+        self.evictions = 0
+
+    def _get_db(self) -> sqlite3.Connection:
+        # Opened on first use so importing the agent never touches the disk
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    used_at REAL NOT NULL,
+                    PRIMARY KEY (model, hash)
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_used_at ON embeddings (used_at)")
+            self._db.commit()
+        return self._db
+
+    def get_many(self, model: str, texts: list[str]) -> list:
+        """Returns the cached vector for each text, or None for texts that aren't cached."""
+        if self.max_entries <= 0:
+            return [None] * len(texts)
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            db = self._get_db()
+            unique = list(dict.fromkeys(hashes))
+            for start in range(0, len(unique), SQL_BATCH_SIZE):
+                batch = unique[start:start + SQL_BATCH_SIZE]
+                rows = db.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({', '.join('?' * len(batch))})",
+                    (model, *batch),
+                ).fetchall()
+                found.update((digest, np.frombuffer(vector, dtype=np.float32)) for digest, vector in rows)
+            if found:
+                # Mark them as used, so they are the last to be evicted
+                db.executemany(
+                    "UPDATE embeddings SET used_at = ? WHERE model = ? AND hash = ?",
+                    [(time.time(), model, digest) for digest in found],
+                )
+                db.commit()
+            vectors = [found.get(digest) for digest in hashes]
+            hits = sum(1 for vector in vectors if vector is not None)
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        return vectors
+
+    def put_many(self, model: str, texts: list[str], vectors):
+        """Stores a vector for each text, then evicts the least recently used vectors if there are too many."""
+        if self.max_entries <= 0:
+            return
+        now = time.time()
+        rows = [
+            (model, text_hash(text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            db = self._get_db()
+            db.executemany("INSERT OR REPLACE INTO embeddings (model, hash, vector, used_at) VALUES (?, ?, ?, ?)", rows)
+            extra = db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_entries
+            if extra > 0:
+                db.execute(
+                    "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY used_at LIMIT ?)",
+                    (extra,),
+                )
+                self.evictions += extra
+            db.commit()
+
+    def embed(self, model: str, texts: list[str], embed, batch_size: int = EMBEDDING_BATCH_SIZE) -> np.ndarray:
+        """
+        Returns a vector for each text, using cached vectors where there are any.
+        embed(texts) is only called for the texts that aren't cached, batch_size texts at a time,
+        and must return one vector (a row of a NumPy array) for each text.
+        """
+        vectors = self.get_many(model, texts)
+        # Each missing text is only embedded once, however often it appears
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        computed = {}
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            batch_vectors = np.asarray(embed(batch), dtype=np.float32)
+            self.put_many(model, batch, batch_vectors)
+            computed.update(zip(batch, batch_vectors))
+            with self._lock:
+                self.embedded += len(batch)
+        return np.stack([vector if vector is not None else computed[text] for text, vector in zip(texts, vectors)])
+
+    def stats(self) -> dict:
+        """Returns hit, miss, and eviction counts, and how many texts were embedded."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "embedded": self.embedded,
+                "evictions": self.evictions,
+            }
+
+
+embedding_cache = EmbeddingCache()
+
+
+def embedding_cache_stats() -> dict:
+    """Gets hit-rate metrics for the embedding cache."""
+    return embedding_cache.stats()
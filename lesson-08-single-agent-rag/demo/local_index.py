@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from .embedding_cache import embedding_cache
+from .ingest import LOCAL_INDEX_DIR, LOCAL_INDEX_DOCS_DIR, index_lock, ingest, iter_index_chunks
+from .words import tokenize
+
+# A local search index over the PDFs in the docs directory.
+#
+# This lets the agent run without a Vertex AI Search engine, for example when
+# working offline or testing. Set DATASTORE_BACKEND=local to use it.
+#
+# Each page of each PDF is split into overlapping chunks of words. A search
+# combines two scores for every chunk:
+# * BM25, which rewards chunks that contain the rarer words of the query
+# * The cosine similarity between "hashed" word vectors of the query and the
+#   chunk. Each word and pair of words is hashed to one of a fixed number of
+#   dimensions, so no embedding model (or network access) is needed.
+#
+# The index is saved as NumPy arrays in LOCAL_INDEX_DIR, which later runs
+# memory-map instead of reading the PDFs again. ingest.py keeps those files
+# up to date, only reading PDFs and computing vectors for chunks that changed.
+# Chunk vectors are also kept in the embedding cache (see embedding_cache.py),
+# so rebuilding an index, or building a second copy of one, doesn't compute
+# them again.
+
+LOCAL_INDEX_DIMENSIONS = int(os.environ.get("LOCAL_INDEX_DIMENSIONS", "1024"))
+# How much the BM25 score counts compared to the vector score (0 to 1)
+LOCAL_INDEX_BM25_WEIGHT = float(os.environ.get("LOCAL_INDEX_BM25_WEIGHT", "0.5"))
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# The name the embedding cache stores our vectors under. Change it whenever
+# tokenize() (in words.py) or hashed_vector() change, so old vectors aren't used.
+EMBEDDING_MODEL = f"hashed-blake2b-v1-{LOCAL_INDEX_DIMENSIONS}"
+
+
+def hashed_vector(tokens: list[str], dimensions: int = LOCAL_INDEX_DIMENSIONS) -> np.ndarray:
+    """Turns words into a normalized vector by hashing each word and pair of words to a dimension."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    features = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    for feature in features:
+        digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        # One bit of the hash picks the sign, so unrelated words tend to cancel out
+        vector[digest % dimensions] += 1.0 if digest >> 63 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def embed_uncached(texts: list[str]) -> np.ndarray:
+    """Computes the hashed vector of each text."""
+    return np.stack([hashed_vector(tokenize(text)) for text in texts])
+
+
+def embed(texts: list[str]) -> np.ndarray:
+    """Gets the hashed vector of each text, only computing the ones that aren't in the embedding cache."""
+    return embedding_cache.embed(EMBEDDING_MODEL, texts, embed_uncached)
+
+
+def _save_array(index_dir: str, name: str, array: np.ndarray):
+    # Write to a temporary file first so a reader never sees half a file
+    path = os.path.join(index_dir, f"{name}.npy")
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, array)
+    os.replace(path + ".tmp", path)
+
+
+def save_postings(chunks, index_dir: str):
+    """Builds the BM25 postings for the chunks (any iterable, read once) and saves them in index_dir."""
+    # For each term, the chunks it appears in and how often, stored as one
+    # long array that is sliced using term_offsets
+    postings = {}
+    chunk_lengths = []
+    for chunk_index, chunk in enumerate(chunks):
+        tokens = tokenize(chunk["content"])
+        chunk_lengths.append(len(tokens))
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            postings.setdefault(token, []).append((chunk_index, count))
+    terms = sorted(postings)
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    for term_index, term in enumerate(terms):
+        term_offsets[term_index + 1] = term_offsets[term_index] + len(postings[term])
+    posting_chunks = np.array([chunk_index for term in terms for chunk_index, _ in postings[term]], dtype=np.int32)
+    posting_counts = np.array([count for term in terms for _, count in postings[term]], dtype=np.float32)
+
+    _save_array(index_dir, "chunk_lengths", np.array(chunk_lengths, dtype=np.float32))
+    _save_array(index_dir, "term_offsets", term_offsets)
+    _save_array(index_dir, "posting_chunks", posting_chunks)
+    _save_array(index_dir, "posting_counts", posting_counts)
+    with open(os.path.join(index_dir, "terms.json"), "w") as f:
+        json.dump(terms, f)
+    # Written last, so an index is only used once every other file is in place
+    with open(os.path.join(index_dir, "meta.json"), "w") as f:
+        json.dump({"dimensions": LOCAL_INDEX_DIMENSIONS, "chunks": len(chunk_lengths)}, f)
+
+
+def _update_index(docs_dir: str, index_dir: str):
+    # The caller holds index_lock(index_dir)
+    report = ingest(embed, docs_dir, index_dir, LOCAL_INDEX_DIMENSIONS)
+    if report["changed"] or not os.path.exists(os.path.join(index_dir, "meta.json")):
+        save_postings(iter_index_chunks(index_dir), index_dir)
+    return report
+
+
+def update_index(docs_dir: str = LOCAL_INDEX_DOCS_DIR, index_dir: str = LOCAL_INDEX_DIR):
+    """
+    Brings the index files up to date with the PDFs, and returns a report of what changed.
+    Holds the lock on index_dir while it does, so other threads and processes wait rather than write the same files.
+    """
+    with index_lock(index_dir):
+        return _update_index(docs_dir, index_dir)
+
+
+class LocalIndex:
+    """A memory-mapped hybrid BM25 and vector index."""
+
+    def __init__(self, index_dir: str = LOCAL_INDEX_DIR, bm25_weight: float = LOCAL_INDEX_BM25_WEIGHT):
+        self.bm25_weight = bm25_weight
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            self.dimensions = json.load(f)["dimensions"]
+        self.chunks = list(iter_index_chunks(index_dir))
+        with open(os.path.join(index_dir, "terms.json")) as f:
+            self.term_index = {term: index for index, term in enumerate(json.load(f))}
+
+        def load(name):
+            return np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+        self.vectors = load("vectors")
+        self.term_offsets = load("term_offsets")
+        self.posting_chunks = load("posting_chunks")
+        self.posting_counts = load("posting_counts")
+        chunk_lengths = load("chunk_lengths")
+
+        # The parts of the BM25 formula that don't depend on the query
+        average_length = float(chunk_lengths.mean()) if len(chunk_lengths) else 0.0
+        self.length_norm = BM25_K1 * (1 - BM25_B + BM25_B * chunk_lengths / (average_length or 1.0))
+        document_frequency = np.diff(self.term_offsets)
+        self.idf = np.log(1 + (len(self.chunks) - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def bm25_scores(self, tokens: list[str]) -> np.ndarray:
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for token in set(tokens):
+            term = self.term_index.get(token)
+            if term is None:
+                continue
+            start, end = self.term_offsets[term], self.term_offsets[term + 1]
+            chunks = self.posting_chunks[start:end]
+            counts = self.posting_counts[start:end]
+            # A chunk appears at most once in each term's postings, so this is safe
+            scores[chunks] += self.idf[term] * counts * (BM25_K1 + 1) / (counts + self.length_norm[chunks])
+        return scores
+
+    def search(self, query: str, limit: int = 10) -> list[dict]:
+        """
+        Returns the best matching chunks for a query, best first.
+        Each has a relevance_score between 0 and 1, the same blend of BM25 and vector scores used to rank them.
+        """
+        if not self.chunks:
+            return []
+        tokens = tokenize(query)
+        bm25 = self.bm25_scores(tokens)
+        if bm25.max() > 0:
+            bm25 /= bm25.max()
+        cosine = np.maximum(self.vectors @ hashed_vector(tokens, self.dimensions), 0)
+        scores = self.bm25_weight * bm25 + (1 - self.bm25_weight) * cosine
+
+        limit = min(limit, len(scores))
+        best = np.argpartition(-scores, limit - 1)[:limit]
+        best = best[np.argsort(-scores[best])]
+        return [
+            {"id": self.chunks[index]["id"], "content": self.chunks[index]["content"], "relevance_score": float(scores[index])}
+            for index in best
+            if scores[index] > 0
+        ]
+
+
+_local_index = None
+_local_index_lock = threading.Lock()
+
+
+def get_local_index(docs_dir: str = LOCAL_INDEX_DOCS_DIR, index_dir: str = LOCAL_INDEX_DIR) -> LocalIndex:
+    """Gets the local index, updating it first if the PDFs have changed since it was saved."""
+    global _local_index
+    if _local_index is None:
+        with _local_index_lock:
+            if _local_index is None:
+                # Loading under the same lock means the files can't be replaced
+                # half way through
+                with index_lock(index_dir):
+                    report = _update_index(docs_dir, index_dir)
+                    if report["changed"]:
+                        print(f"Updated the local search index for {docs_dir}: {report}")
+                    _local_index = LocalIndex(index_dir)
+    return _local_index
+
+
+def search_chunks(search_query: str, limit: int = 10) -> list[dict]:
+    """Searches the local index and returns the ID and content of each matching chunk, best match first."""
+    return get_local_index().search(search_query, limit)
+
+
+def search(
+    project_id: str,
+    location: str,
+    engine_id: str,
+    search_query: str,
+) -> list[str]:
+    # Same signature as datastore.search(), but the project, location, and
+    # engine aren't needed for a local index
+    return [chunk["content"] for chunk in search_chunks(search_query)]
@@ -0,0 +1,139 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .words import tokenize
+
+# Speculative search prefetching.
+#
+# Nearly every question the agent gets leads to a datastore search, but only
+# after a full model call has decided what to search for. To overlap the two,
+# a before-agent callback (see datastore.py) starts searching for the user's
+# message as soon as it arrives, while the model is still thinking. If the
+# model then searches for something similar enough, the search tool uses the
+# prefetched results instead of searching again.
+#
+# Prefetches are kept for each invocation (one user turn), and any that
+# weren't used are cancelled by an after-agent callback. A prefetch that has
+# already started can't be stopped part way, but its results are dropped
+# (and kept in the search cache, in case they are needed later).
+#
+# Each prefetch is a search that may never be used, and Vertex AI Search
+# bills every one, so prefetching is off unless SEARCH_PREFETCH is set. Even
+# then, messages with fewer than SEARCH_PREFETCH_MIN_WORDS words that aren't
+# very common ("hi", "thanks!") don't start one. Prefetches run on their own
+# small pool of threads, so they never hold up the searches the model asks for.
+
+SEARCH_PREFETCH = os.environ.get("SEARCH_PREFETCH", "false").lower() in ("1", "true", "yes")
+SEARCH_PREFETCH_MIN_WORDS = int(os.environ.get("SEARCH_PREFETCH_MIN_WORDS", "3"))
+SEARCH_PREFETCH_MAX_CONCURRENCY = int(os.environ.get("SEARCH_PREFETCH_MAX_CONCURRENCY", "2"))
+# The fraction of the words in the model's query that must also be in the
+# user's message for the prefetched results to be used
+SEARCH_PREFETCH_MIN_OVERLAP = float(os.environ.get("SEARCH_PREFETCH_MIN_OVERLAP", "0.5"))
+
+
+class _Prefetch:
+    def __init__(self, query: str, future):
+        self.query = query
+        self.words = set(tokenize(query))
+        self.future = future
+
+
+class Prefetcher:
+    """Keeps the searches started for user messages, and hands one to the search tool if its query is similar."""
+
+    def __init__(self, min_overlap: float = SEARCH_PREFETCH_MIN_OVERLAP):
+        self.min_overlap = min_overlap
+        self._prefetches = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.used = 0
+        self.cancelled = 0
+
+    def start(self, invocation_id: str, query: str, future):
+        """Remembers a search that was started in the background (as a Future) for query."""
+        with self._lock:
+            self._prefetches[invocation_id] = _Prefetch(query, future)
+            self.started += 1
+
+    def similar(self, prefetch: _Prefetch, search_query: str) -> bool:
+        words = set(tokenize(search_query))
+        if not words:
+            return False
+        return len(words & prefetch.words) / len(words) >= self.min_overlap
+
+    def take(self, invocation_id: str, search_query: str):
+        """Returns the prefetched search for this invocation if it is similar to search_query, or None."""
+        with self._lock:
+            prefetch = self._prefetches.get(invocation_id)
+            if prefetch is None or not self.similar(prefetch, search_query):
+                return None
+            # Each prefetch is only used once
+            del self._prefetches[invocation_id]
+            self.used += 1
+            return prefetch.future
+
+    def cancel(self, invocation_id: str):
+        """Cancels the prefetch for this invocation if it wasn't used."""
+        with self._lock:
+            prefetch = self._prefetches.pop(invocation_id, None)
+            if prefetch is not None:
+                prefetch.future.cancel()
+                self.cancelled += 1
+
+    def stats(self) -> dict:
+        """Returns how many prefetches were started, used, and cancelled."""
+        with self._lock:
+            return {
+                "started": self.started,
+                "used": self.used,
+                "cancelled": self.cancelled,
+                "hit_rate": self.used / self.started if self.started else 0.0,
+                "pending": len(self._prefetches),
+            }
+
+
+prefetcher = Prefetcher()
+prefetch_executor = ThreadPoolExecutor(max_workers=SEARCH_PREFETCH_MAX_CONCURRENCY, thread_name_prefix="prefetch")
+
+
+def worth_prefetching(message: str) -> bool:
+    """Checks cheaply whether a user message looks enough like a question to search for."""
+    return SEARCH_PREFETCH and len(tokenize(message)) >= SEARCH_PREFETCH_MIN_WORDS
+
+
+def user_message_text(callback_context) -> str:
+    """Gets the text of the message the user just sent."""
+    content = callback_context.user_content
+    if not content or not content.parts:
+        return ""
+    return " ".join(part.text for part in content.parts if part.text).strip()
+
+
+def prefetched_results(tool_context, search_query: str) -> list[str]:
+    """Gets the prefetched results if they match this query, or None if the tool should search itself."""
+    future = prefetcher.take(tool_context.invocation_id, search_query) if tool_context else None
+    if future is None:
+        return None
+    try:
+        return [chunk["content"] for chunk in future.result()]
+    except Exception as e:
+        print(f"Prefetched search failed, searching again: {e}")
+        return None
+
+
+async def prefetched_results_async(tool_context, search_query: str) -> list[str]:
+    """Gets the prefetched results if they match this query, or None if the tool should search itself."""
+    future = prefetcher.take(tool_context.invocation_id, search_query) if tool_context else None
+    if future is None:
+        return None
+    try:
+        return [chunk["content"] for chunk in await asyncio.wrap_future(future)]
+    except Exception as e:
+        print(f"Prefetched search failed, searching again: {e}")
+        return None
+
+
+def search_prefetch_stats() -> dict:
+    """Gets hit-rate metrics for search prefetching."""
+    return prefetcher.stats()
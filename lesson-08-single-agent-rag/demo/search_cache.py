@@ -0,0 +1,112 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# A cache of datastore search results.
+#
+# The agent often asks the datastore the same question, or one that only
+# differs in case, spacing, or a trailing question mark. We normalize the
+# query text and cache the results, keyed on the normalized query, the
+# engine, the location, and the search settings that were used, so these
+# repeated searches are answered without leaving the process.
+#
+# Entries expire after a TTL, and the least recently used entries are dropped
+# once the cache is full. When the documents in a datastore are re-indexed,
+# call invalidate_search_cache() (or change DATASTORE_INDEX_VERSION and
+# restart) so stale results aren't returned.
+
+SEARCH_CACHE_TTL_SECONDS = float(os.environ.get("SEARCH_CACHE_TTL_SECONDS", "3600"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", "1024"))
+DATASTORE_INDEX_VERSION = os.environ.get("DATASTORE_INDEX_VERSION", "")
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Normalizes a search query so trivially different queries share a cache entry."""
+    query = _whitespace.sub(" ", query.casefold()).strip()
+    return query.strip(" ?!.,;:")
+
+
+class SearchCache:
+    """Caches search results keyed on the normalized query, engine, location, and search settings."""
+
+    def __init__(
+        self,
+        ttl_seconds: float = SEARCH_CACHE_TTL_SECONDS,
+        max_entries: int = SEARCH_CACHE_MAX_ENTRIES,
+        index_version: str = DATASTORE_INDEX_VERSION,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.index_version = index_version
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def make_key(self, engine_id: str, location: str, search_query: str, search_spec: dict) -> tuple:
+        """Builds the cache key for a search."""
+        spec = json.dumps(search_spec, sort_keys=True, default=str)
+        return (engine_id, location, self.index_version, spec, normalize_query(search_query))
+
+    def get(self, engine_id: str, location: str, search_query: str, search_spec: dict):
+        """Returns (True, results) for cached results, or (False, None) if the search must be run."""
+        key = self.make_key(engine_id, location, search_query, search_spec)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[1] >= time.time() - self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, list(cached[0])
+
+            self.misses += 1
+            return False, None
+
+    def put(self, engine_id: str, location: str, search_query: str, search_spec: dict, results: list):
+        """Stores the results of a search."""
+        key = self.make_key(engine_id, location, search_query, search_spec)
+        with self._lock:
+            self._entries[key] = (list(results), time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, engine_id: str = None):
+        """Drops the cached results for one engine, or for every engine if none is given."""
+        with self._lock:
+            if engine_id is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == engine_id]:
+                    del self._entries[key]
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        """Returns hit and miss counts."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "invalidations": self.invalidations,
+            }
+
+
+search_cache = SearchCache()
+
+
+def invalidate_search_cache(engine_id: str = None):
+    """Drops cached search results, for example after the datastore was re-indexed."""
+    search_cache.invalidate(engine_id)
+
+
+def search_cache_stats() -> dict:
+    """Gets hit-rate metrics for the search cache."""
+    return search_cache.stats()
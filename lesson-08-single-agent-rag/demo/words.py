@@ -0,0 +1,18 @@
+import re
+
+# Splits text into the words that the local index and search prefetching
+# compare. This is kept apart from local_index.py so that prefetching doesn't
+# need NumPy or pypdf when the agent searches Vertex AI Search.
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in",
+    "is", "it", "of", "on", "or", "that", "the", "this", "to", "was", "what",
+    "when", "where", "which", "who", "with",
+}
+
+_word = re.compile(r"[a-z0-9]+(?:[.'][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> list[str]:
+    """Splits text into lowercase words, leaving out very common words."""
+    return [word for word in _word.findall(text.casefold()) if word not in STOPWORDS]
@@ -1,6 +1,6 @@
 import os
 from google.adk.agents import Agent
-from .datastore import datastore_search_tool
+from .datastore import datastore_search_tool, warm_search_client
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 instruction_file_path = os.path.join(script_dir, "agent-prompt.txt")
@@ -9,6 +9,9 @@ with open(instruction_file_path, "r") as f:
 
 model = "gemini-2.5-flash"
 
+# Set up the search client now, rather than during the first question
+warm_search_client()
+
 tools = [datastore_search_tool]
 
 root_agent = Agent(
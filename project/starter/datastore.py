@@ -1,3 +1,5 @@
+import os
+import threading
 from google.api_core.client_options import ClientOptions
 from google.cloud import discoveryengine_v1 as discoveryengine
 
@@ -13,22 +15,53 @@ from google.cloud import discoveryengine_v1 as discoveryengine
 # You can see the definitions at
 # https://cloud.google.com/python/docs/reference/discoveryengine/latest/google.cloud.discoveryengine_v1.types
 #
+
+# "vertex" searches the Vertex AI Search engine in DATASTORE_ENGINE_ID, while
+# "local" searches an index of the PDFs in docs/ (see local_index.py)
+DATASTORE_BACKEND = os.environ.get("DATASTORE_BACKEND", "vertex")
+if DATASTORE_BACKEND == "local":
+  # Only the local backend needs NumPy and pypdf
+  from . import local_index
+
+# Creating a SearchServiceClient sets up a new gRPC channel, so instead of
+# creating one for every search we keep one client per API endpoint and share
+# it between all searches. The clients are safe to use from several threads.
+_search_clients = {}
+_search_clients_lock = threading.Lock()
+
+def get_api_endpoint(location: str) -> str:
+  """Gets the Vertex AI Search API endpoint for a location."""
+  #  For more information, refer to:
+  # https://cloud.google.com/generative-ai-app-builder/docs/locations#specify_a_multi-region_for_your_data_store
+  if location == "global":
+    return discoveryengine.SearchServiceClient.DEFAULT_ENDPOINT
+  return f"{location}-discoveryengine.googleapis.com"
+
+def get_search_client(location: str) -> discoveryengine.SearchServiceClient:
+  """Gets the shared SearchServiceClient for a location, creating it the first time."""
+  api_endpoint = get_api_endpoint(location)
+  client = _search_clients.get(api_endpoint)
+  if client is None:
+    with _search_clients_lock:
+      client = _search_clients.get(api_endpoint)
+      if client is None:
+        client = discoveryengine.SearchServiceClient(
+          client_options=ClientOptions(api_endpoint=api_endpoint)
+        )
+        _search_clients[api_endpoint] = client
+  return client
+
 def search(
     project_id: str,
     location: str,
     engine_id: str,
     search_query: str,
 ) -> list[str]:
-  #  For more information, refer to:
-  # https://cloud.google.com/generative-ai-app-builder/docs/locations#specify_a_multi-region_for_your_data_store
-  client_options = (
-    ClientOptions(api_endpoint=f"{location}-discoveryengine.googleapis.com")
-    if location != "global"
-    else None
-  )
-
-  # Create a client
-  client = discoveryengine.SearchServiceClient(client_options=client_options)
+  if DATASTORE_BACKEND == "local":
+    return local_index.search(project_id, location, engine_id, search_query)
+
+  # Get the shared client for this location
+  client = get_search_client(location)
 
   # The full resource name of the search app serving config
   serving_config = f"projects/{project_id}/locations/{location}/collections/default_collection/engines/{engine_id}/servingConfigs/default_config"
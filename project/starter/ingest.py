@@ -0,0 +1,387 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+import numpy as np
+from pypdf import PdfReader
+
+# File locks work differently on Windows
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+  import msvcrt
+
+# Incremental ingestion of the PDFs in the docs directory.
+#
+# Each PDF is read one page at a time and split into chunks with stable IDs
+# (file name, page, and position on the page) and a hash of their content.
+# A manifest in the index directory records the hash of every file and every
+# chunk, so on the next run:
+# * Files whose content hasn't changed aren't read again
+# * Only chunks that are new or whose content changed are embedded again,
+#   the vectors for every other chunk are copied from the previous run
+# * With --upload, only new and changed chunks are sent to a Vertex AI Search
+#   data store, and chunks that no longer exist are deleted from it
+#
+# Chunks are streamed one at a time into the chunk and vector files, so the
+# whole corpus is never held in memory. Both files are written under
+# temporary names and then swapped in. Only one ingest at a time may write
+# to an index directory, even from different processes, so it is done while
+# holding a lock file in that directory (see index_lock()).
+#
+# local_index.py runs this whenever the agent loads the local index. To run
+# it by hand, from the project directory:
+#   python -m starter.ingest
+#   python -m starter.ingest --upload
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+LOCAL_INDEX_DOCS_DIR = os.environ.get("LOCAL_INDEX_DOCS_DIR", os.path.join(script_dir, "docs"))
+LOCAL_INDEX_DIR = os.environ.get("LOCAL_INDEX_DIR", os.path.join(script_dir, ".local_index"))
+LOCAL_INDEX_CHUNK_WORDS = int(os.environ.get("LOCAL_INDEX_CHUNK_WORDS", "200"))
+LOCAL_INDEX_CHUNK_OVERLAP = int(os.environ.get("LOCAL_INDEX_CHUNK_OVERLAP", "40"))
+
+# How many new vectors to compute in one call to embed()
+EMBED_BATCH_SIZE = 256
+# The most documents Vertex AI Search accepts in one inline import
+UPLOAD_BATCH_SIZE = 100
+
+
+def file_hash(path: str) -> str:
+  """Hashes the content of a file, a block at a time."""
+  digest = hashlib.sha256()
+  with open(path, "rb") as f:
+    for block in iter(lambda: f.read(1024 * 1024), b""):
+      digest.update(block)
+  return digest.hexdigest()
+
+
+def content_hash(text: str) -> str:
+  return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def iter_pages(path: str):
+  """Yields the page number and text of each page of a PDF, reading one page at a time."""
+  # Passing an open file, rather than a path, stops pypdf reading the whole
+  # file into memory first
+  with open(path, "rb") as f:
+    reader = PdfReader(f)
+    for page_number, page in enumerate(reader.pages, start=1):
+      yield page_number, page.extract_text() or ""
+
+
+def chunk_words(words: list[str], size: int = LOCAL_INDEX_CHUNK_WORDS, overlap: int = LOCAL_INDEX_CHUNK_OVERLAP):
+  """Yields overlapping runs of words."""
+  step = max(1, size - overlap)
+  for start in range(0, max(1, len(words) - overlap), step):
+    yield words[start:start + size]
+
+
+def iter_chunks(path: str):
+  """Yields the chunks of a PDF with their stable ID and content hash."""
+  filename = os.path.basename(path)
+  for page_number, text in iter_pages(path):
+    for chunk_number, chunk in enumerate(chunk_words(text.split())):
+      if chunk:
+        content = " ".join(chunk)
+        yield {
+          "id": f"{filename}:p{page_number}:c{chunk_number}",
+          "source": filename,
+          "page": page_number,
+          "content": content,
+          "hash": content_hash(content),
+        }
+
+
+def load_manifest(index_dir: str) -> dict:
+  try:
+    with open(os.path.join(index_dir, "manifest.json")) as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return {}
+
+
+def save_manifest(index_dir: str, manifest: dict):
+  path = os.path.join(index_dir, "manifest.json")
+  with open(path + ".tmp", "w") as f:
+    json.dump(manifest, f)
+  os.replace(path + ".tmp", path)
+
+
+@contextmanager
+def index_lock(index_dir: str):
+  """Holds an exclusive lock on index_dir, waiting for any other thread or process that holds it."""
+  os.makedirs(index_dir, exist_ok=True)
+  with open(os.path.join(index_dir, ".lock"), "a+b") as f:
+    if fcntl:
+      fcntl.flock(f, fcntl.LOCK_EX)
+    else:
+      # msvcrt only waits about 10 seconds before giving up, so keep trying
+      while True:
+        try:
+          msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+          break
+        except OSError:
+          time.sleep(0.1)
+    try:
+      yield
+    finally:
+      if fcntl:
+        fcntl.flock(f, fcntl.LOCK_UN)
+      else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def iter_index_chunks(index_dir: str):
+  """Yields the chunks in index_dir one at a time, in the same order as the rows of vectors.npy."""
+  try:
+    f = open(os.path.join(index_dir, "chunks.jsonl"))
+  except OSError:
+    return
+  with f:
+    for line in f:
+      yield json.loads(line)
+
+
+def index_chunk_rows(index_dir: str) -> dict:
+  """
+  Maps the ID of each chunk in index_dir to its row in vectors.npy, its content hash, and where its
+  line starts in chunks.jsonl, so chunks can be copied from the old index without keeping them in memory.
+  """
+  rows = {}
+  try:
+    with open(os.path.join(index_dir, "chunks.jsonl"), "rb") as f:
+      offset = 0
+      for row, line in enumerate(f):
+        chunk = json.loads(line)
+        rows[chunk["id"]] = (row, chunk["hash"], offset)
+        offset += len(line)
+  except (OSError, ValueError):
+    return {}
+  return rows
+
+
+def ingest(embed, docs_dir: str = LOCAL_INDEX_DOCS_DIR, index_dir: str = LOCAL_INDEX_DIR, dimensions: int = None):
+  """
+  Brings chunks.jsonl, vectors.npy, and the manifest in index_dir up to date with the PDFs in docs_dir.
+  embed(texts) must return one vector (a row of a NumPy array) for each text.
+  Chunks are streamed from the PDFs (or the old index) into the new files, so the corpus is never all in memory.
+  Returns a report of what changed. Use iter_index_chunks() to read the chunks.
+  Call it while holding index_lock(index_dir), as local_index.update_index() does.
+  """
+  os.makedirs(index_dir, exist_ok=True)
+  manifest = load_manifest(index_dir)
+  settings = {"chunk_words": LOCAL_INDEX_CHUNK_WORDS, "chunk_overlap": LOCAL_INDEX_CHUNK_OVERLAP, "dimensions": dimensions}
+  chunks_path = os.path.join(index_dir, "chunks.jsonl")
+  vectors_path = os.path.join(index_dir, "vectors.npy")
+  rebuild = manifest.get("settings") != settings or not os.path.exists(vectors_path) or not os.path.exists(chunks_path)
+  old_rows = {} if rebuild else index_chunk_rows(index_dir)
+  # If the files are out of step (say, a crash between replacing one and the other), start again
+  rebuild = rebuild or len(old_rows) != len(np.load(vectors_path, mmap_mode="r"))
+  if rebuild:
+    # Different chunking or vectors can't be reused, so start again, but
+    # remember what was uploaded
+    manifest = {"uploaded": manifest.get("uploaded", {})}
+    old_rows = {}
+  old_files = manifest.get("files", {})
+
+  report = {"files_read": 0, "files_unchanged": 0, "chunks_embedded": 0, "chunks_unchanged": 0, "chunks_removed": 0}
+  files = {}
+  for filename in sorted(os.listdir(docs_dir)):
+    if not filename.lower().endswith(".pdf"):
+      continue
+    digest = file_hash(os.path.join(docs_dir, filename))
+    old_file = old_files.get(filename)
+    if old_file and old_file["sha256"] == digest and all(chunk_id in old_rows for chunk_id in old_file["chunks"]):
+      files[filename] = old_file
+      report["files_unchanged"] += 1
+    else:
+      files[filename] = {"sha256": digest, "chunks": None}
+      report["files_read"] += 1
+
+  if not rebuild and not report["files_read"] and files.keys() == old_files.keys():
+    # Nothing to write
+    report["chunks_unchanged"] = len(old_rows)
+    report["changed"] = False
+    return report
+
+  def file_chunks(filename: str):
+    if files[filename]["chunks"] is not None:
+      # Copy the chunks of an unchanged file from the old index
+      with open(chunks_path, "rb") as f:
+        for chunk_id in files[filename]["chunks"]:
+          f.seek(old_rows[chunk_id][2])
+          yield json.loads(f.readline())
+    else:
+      files[filename]["chunks"] = []
+      for chunk in iter_chunks(os.path.join(docs_dir, filename)):
+        files[filename]["chunks"].append(chunk["id"])
+        yield chunk
+
+  # Each chunk is written to the new chunks file as soon as we have it, and
+  # its vector to its row of a file of raw vectors. Vectors that can't be
+  # reused are computed a batch at a time.
+  old_vectors = np.load(vectors_path, mmap_mode="r") if old_rows else None
+  rows_path = vectors_path + ".rows.tmp"
+  row_bytes = dimensions * np.dtype(np.float32).itemsize
+  count = 0
+  kept = 0
+  pending = []
+  with open(chunks_path + ".tmp", "w") as chunks_file, open(rows_path, "wb") as rows_file:
+
+    def write_row(row: int, vector):
+      rows_file.seek(row * row_bytes)
+      rows_file.write(np.asarray(vector, dtype=np.float32).tobytes())
+
+    def embed_pending():
+      vectors = embed([content for _, content in pending])
+      for (row, _), vector in zip(pending, vectors):
+        write_row(row, vector)
+      pending.clear()
+
+    for filename in files:
+      for chunk in file_chunks(filename):
+        chunks_file.write(json.dumps(chunk) + "\n")
+        old = old_rows.get(chunk["id"])
+        if old:
+          kept += 1
+        if old and old[1] == chunk["hash"]:
+          write_row(count, old_vectors[old[0]])
+          report["chunks_unchanged"] += 1
+        else:
+          pending.append((count, chunk["content"]))
+          if len(pending) >= EMBED_BATCH_SIZE:
+            embed_pending()
+        count += 1
+    if pending:
+      embed_pending()
+  del old_vectors
+
+  report["chunks_removed"] = len(old_rows) - kept
+  report["chunks_embedded"] = count - report["chunks_unchanged"]
+  report["changed"] = rebuild or bool(report["chunks_embedded"] or report["chunks_removed"])
+
+  if report["changed"]:
+    # Copy the raw vectors into a .npy file, a batch at a time
+    new_vectors = np.lib.format.open_memmap(vectors_path + ".tmp", mode="w+", dtype=np.float32, shape=(count, dimensions))
+    if count:
+      rows = np.memmap(rows_path, dtype=np.float32, mode="r", shape=(count, dimensions))
+      for start in range(0, count, EMBED_BATCH_SIZE):
+        new_vectors[start:start + EMBED_BATCH_SIZE] = rows[start:start + EMBED_BATCH_SIZE]
+      del rows
+    new_vectors.flush()
+    del new_vectors
+    # local_index.py writes meta.json once the rest of the index matches
+    # these files, so an index is never used while they are being replaced
+    meta_path = os.path.join(index_dir, "meta.json")
+    if os.path.exists(meta_path):
+      os.remove(meta_path)
+    os.replace(vectors_path + ".tmp", vectors_path)
+    os.replace(chunks_path + ".tmp", chunks_path)
+  else:
+    os.remove(chunks_path + ".tmp")
+  os.remove(rows_path)
+
+  manifest.update({"settings": settings, "files": files})
+  save_manifest(index_dir, manifest)
+  return report
+
+
+def document_id(chunk_id: str) -> str:
+  # Document IDs may only use letters, digits, "-" and "_", so use a hash of the chunk ID
+  return hashlib.sha256(chunk_id.encode("utf-8")).hexdigest()[:63]
+
+
+def upload(index_dir: str = LOCAL_INDEX_DIR):
+  """
+  Sends new and changed chunks in index_dir to the Vertex AI Search data store in DATASTORE_ID, and
+  deletes chunks that no longer exist. Use a data store that only holds these chunks.
+  """
+  from google.api_core.client_options import ClientOptions
+  from google.api_core.exceptions import NotFound
+  from google.cloud import discoveryengine_v1 as discoveryengine
+
+  project_id = os.environ.get("DATASTORE_PROJECT_ID")
+  location = os.environ.get("DATASTORE_LOCATION", "global")
+  datastore_id = os.environ.get("DATASTORE_ID")
+  client_options = (
+    ClientOptions(api_endpoint=f"{location}-discoveryengine.googleapis.com")
+    if location != "global"
+    else None
+  )
+  client = discoveryengine.DocumentServiceClient(client_options=client_options)
+  parent = f"projects/{project_id}/locations/{location}/collections/default_collection/dataStores/{datastore_id}/branches/default_branch"
+
+  manifest = load_manifest(index_dir)
+  uploaded = manifest.get("uploaded", {})
+
+  def import_batch(batch: list[dict]):
+    documents = [
+      discoveryengine.Document(
+        id=document_id(chunk["id"]),
+        struct_data={"chunk_id": chunk["id"], "source": chunk["source"], "page": chunk["page"]},
+        content=discoveryengine.Document.Content(raw_bytes=chunk["content"].encode("utf-8"), mime_type="text/plain"),
+      )
+      for chunk in batch
+    ]
+    request = discoveryengine.ImportDocumentsRequest(
+      parent=parent,
+      inline_source=discoveryengine.ImportDocumentsRequest.InlineSource(documents=documents),
+      reconciliation_mode=discoveryengine.ImportDocumentsRequest.ReconciliationMode.INCREMENTAL,
+    )
+    client.import_documents(request=request).result()
+    # Record progress after each batch, so an interrupted upload can carry on where it stopped
+    uploaded.update({chunk["id"]: chunk["hash"] for chunk in batch})
+    manifest["uploaded"] = uploaded
+    save_manifest(index_dir, manifest)
+
+  # Only one batch of chunks is held in memory at a time
+  current_ids = set()
+  changed = 0
+  batch = []
+  for chunk in iter_index_chunks(index_dir):
+    current_ids.add(chunk["id"])
+    if uploaded.get(chunk["id"]) != chunk["hash"]:
+      batch.append(chunk)
+      changed += 1
+      if len(batch) >= UPLOAD_BATCH_SIZE:
+        import_batch(batch)
+        batch = []
+  if batch:
+    import_batch(batch)
+
+  removed = [chunk_id for chunk_id in uploaded if chunk_id not in current_ids]
+  for chunk_id in removed:
+    try:
+      client.delete_document(name=f"{parent}/documents/{document_id(chunk_id)}")
+    except NotFound:
+      pass
+    del uploaded[chunk_id]
+  manifest["uploaded"] = uploaded
+  save_manifest(index_dir, manifest)
+  return {"chunks_uploaded": changed, "chunks_deleted": len(removed)}
+
+
+def main():
+  from .embedding_cache import embedding_cache_stats
+  # update_index() holds the index lock, so this can't write the index at
+  # the same time as an agent (or the one agent.py starts on import)
+  from .local_index import update_index
+
+  parser = argparse.ArgumentParser(description="Bring the local index (and optionally a data store) up to date with the PDFs in docs.")
+  parser.add_argument("--upload", action="store_true", help="Also upload changed chunks to the data store in DATASTORE_ID")
+  args = parser.parse_args()
+
+  report = update_index()
+  report["embedding_cache"] = embedding_cache_stats()
+  if args.upload:
+    report.update(upload())
+  print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+  main()